@@ -0,0 +1,54 @@
+"""Prompt rendering throughput.
+
+Measures ``build_lyrics_prompt`` with the spec render cache cold and warm,
+and the six section variations of one request, which share a single spec
+render.
+
+    python benchmarks/bench_prompts.py [iterations]
+"""
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import prompts  # noqa: E402
+
+SPEC = SimpleNamespace(
+    title="Neon Harbor", topic="Leaving a coastal city at night", genre="Pop", subgenre="Synthpop",
+    mood="Wistful", custom_mood="", perspective="We", structure="Verse/Chorus/Verse/Chorus/Bridge/Chorus",
+    rhyme_scheme="ABAB", rhyme_variety=65, internal_rhyme_density=40, cadence_complexity=75,
+    imagery_progression=True, word_choice=60, directness=80, profanity="None",
+    forbidden_words=["baby", "tonight"], ai_freedom=55, sample_lyrics="",
+)
+LYRICS = "\n\n".join(f"[{name}]\n" + "\n".join(["Line of the song with a few words"] * 4) for name in ("VERSE 1", "CHORUS", "VERSE 2", "BRIDGE"))
+
+
+def rate(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def cold():
+    prompts._render_spec.cache_clear()
+    prompts.build_lyrics_prompt(SPEC, LYRICS)
+
+
+def warm():
+    prompts.build_lyrics_prompt(SPEC, LYRICS)
+
+
+def variations():
+    for _ in range(6):
+        prompts.build_variation_prompt(SPEC, LYRICS, "CHORUS", "ABAB")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"build_lyrics_prompt, cold spec render   {rate(cold, iterations):>10,.0f} prompts/s")
+    print(f"build_lyrics_prompt, memoized spec      {rate(warm, iterations):>10,.0f} prompts/s")
+    print(f"6 section variations (one request)      {rate(variations, iterations // 6):>10,.0f} requests/s")
+    print(prompts._render_spec.cache_info())
@@ -0,0 +1,80 @@
+"""CPU cost of serializing ``list_songs`` and ``get_song`` responses.
+
+Compares FastAPI's default path for ``response_model`` routes
+(``jsonable_encoder`` followed by ``JSONResponse``) with ``fast_json``, and
+reports what gzip and brotli do to the body size. Documents are synthetic but
+shaped like stored songs, with realistic lyrics and version metadata.
+
+    python benchmarks/bench_serialization.py [page_size] [iterations]
+"""
+import gzip
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from http_encoding import brotli, fast_json, orjson  # noqa: E402
+
+VERSE = "\n".join([
+    "Neon on the water and the midnight in your eyes",
+    "Every word we never said is burning through the skies",
+    "Hold me like the city holds the echo of the rain",
+    "We were only headlights on a never-ending lane",
+])
+
+
+def make_song(index: int) -> dict:
+    now = datetime.now(timezone.utc) - timedelta(minutes=index)
+    lyrics = "\n\n".join(f"[{name}]\n{VERSE}" for name in ("VERSE 1", "CHORUS", "VERSE 2", "CHORUS", "BRIDGE", "CHORUS"))
+    return {
+        "song_id": f"song_{uuid.uuid4().hex[:12]}",
+        "user_id": "user_benchmark",
+        "title": f"Benchmark Song {index}",
+        "song_spec_json": {
+            "genre": "synthpop", "mood": "wistful", "tempo_bpm": 112,
+            "themes": ["night", "city", "distance"], "structure": "VCVCBC",
+        },
+        "lyrics_text": lyrics,
+        "status": "draft",
+        "used_in_final_track": False,
+        "lyrics_version": 12,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+    }
+
+
+def cpu_per_call(fn, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def report(name: str, payload, iterations: int) -> None:
+    default = cpu_per_call(lambda: JSONResponse(jsonable_encoder(payload)).body, iterations)
+    fast = cpu_per_call(lambda: fast_json(payload).body, iterations)
+    body = fast_json(payload).body
+    print(f"{name}")
+    print(f"  default encoder   {default:9.1f} us/request")
+    print(f"  fast_json         {fast:9.1f} us/request  ({default - fast:.1f} us saved, {default / fast:.1f}x)")
+    gz = cpu_per_call(lambda: gzip.compress(body, compresslevel=6), iterations)
+    print(f"  body {len(body):,} B, gzip {len(gzip.compress(body, compresslevel=6)):,} B ({gz:.1f} us)", end="")
+    if brotli is not None:
+        br = cpu_per_call(lambda: brotli.compress(body, quality=4), iterations)
+        print(f", br {len(brotli.compress(body, quality=4)):,} B ({br:.1f} us)")
+    else:
+        print(", br unavailable")
+
+
+if __name__ == "__main__":
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"orjson: {'yes' if orjson is not None else 'no (stdlib fallback)'}")
+    report("get_song", make_song(0), iterations * 10)
+    report(f"list_songs ({page_size} songs)", [make_song(i) for i in range(page_size)], iterations)
@@ -0,0 +1,172 @@
+"""Response encoding: fast JSON rendering and content compression.
+
+``FastJSONResponse`` renders with orjson when it is installed, which handles
+datetimes natively and is several times faster than the stdlib encoder on
+large song documents. Handlers that return it directly also skip FastAPI's
+``jsonable_encoder`` pass over the payload.
+
+``CompressionMiddleware`` compresses responses above a size threshold with
+brotli (when the ``brotli`` package is installed) or gzip, picking whichever
+the client accepts. Streamed NDJSON is compressed chunk by chunk with a sync
+flush after every chunk so tokens still reach the client as they arrive.
+"""
+import gzip
+import zlib
+from typing import Any, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import stage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, falling back to the stdlib encoder."""
+
+    def render(self, content: Any) -> bytes:
+        with stage("serialize"):
+            if orjson is not None:
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+            return super().render(jsonable_encoder(content))
+
+
+def fast_json(content: Any, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> FastJSONResponse:
+    """Return ``content`` as-is, bypassing response-model validation and encoding."""
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+# Already-compressed or latency-sensitive bodies are passed through untouched
+INCOMPRESSIBLE_TYPES = ("image/", "audio/", "video/", "application/zip", "application/gzip", "text/event-stream")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, honouring ``q=0``."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=min(level, 11))
+        else:
+            self._gz = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + (self._br.flush() if flush else b"")
+        return self._gz.compress(data) + (self._gz.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._br.finish()
+        return self._gz.flush(zlib.Z_FINISH)
+
+
+def compress_body(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level)
+
+
+class CompressionMiddleware:
+    """Compress responses of at least ``minimum_size`` bytes with br or gzip."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        level = self.brotli_quality if encoding == "br" else self.gzip_level
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in headers
+                    or message["status"] < 200 or message["status"] in (204, 304)
+                    or content_type.startswith(INCOMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None and start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if not more_body:
+                    # Whole body in one message: compress it in one shot, or
+                    # send it as-is when it is too small to be worth it.
+                    if len(body) >= self.minimum_size:
+                        body = compress_body(body, encoding, level)
+                        headers["Content-Encoding"] = encoding
+                        headers["Content-Length"] = str(len(body))
+                        headers.add_vary_header("Accept-Encoding")
+                    await send(start)
+                    start = None
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                compressor = _Compressor(encoding, level)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                await send(start)
+                start = None
+
+            if compressor is None:
+                await send(message)
+                return
+            data = compressor.compress(body, flush=more_body)
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
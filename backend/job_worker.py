@@ -0,0 +1,35 @@
+"""Standalone lyrics job worker.
+
+Runs the same job workers as the API process, without serving HTTP, so the
+number of workers can be scaled independently. Start API processes with
+``LYRICS_JOB_WORKERS=0`` and run one or more of these:
+
+    python job_worker.py [workers]
+"""
+import asyncio
+import sys
+
+import server
+
+
+async def main(workers: int):
+    await server.llm_gateway.start()
+    await asyncio.to_thread(server.prosody.get_table)
+    server.job_workers.workers = workers
+    server.job_workers.start()
+    server.usage_meter.start()
+    server.logger.info(f"Lyrics job worker {server.job_workers.worker_id} running {workers} workers")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.job_workers.stop()
+        await server.usage_meter.stop()
+        await server.llm_gateway.close()
+        server.client.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 4))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,163 @@
+"""Server-side lyrics parser and section index.
+
+Lyrics follow the ``[VERSE 1]`` / ``[CHORUS]`` header convention. A single
+pass over the text produces a compact index of sections, lines and word
+tokens with absolute character offsets, so section operations can slice the
+original string instead of re-scanning it.
+"""
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+SECTION_HEADER_RE = re.compile(r"^\s*\[([^\]]+)\]\s*$")
+WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['’][A-Za-z]+)*")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+
+
+class Token(NamedTuple):
+    start: int
+    end: int
+    syllables: int
+
+
+class Line(NamedTuple):
+    start: int
+    end: int
+    tokens: Tuple[Token, ...]
+
+    @property
+    def syllables(self) -> int:
+        return sum(t.syllables for t in self.tokens)
+
+
+class Section(NamedTuple):
+    header: str
+    start: int
+    end: int
+    lines: Tuple[Line, ...]
+
+    @property
+    def name(self) -> str:
+        return normalize_section_name(self.header)
+
+
+class ParsedLyrics(NamedTuple):
+    text: str
+    sections: Tuple[Section, ...]
+
+    def section_text(self, section: Section) -> str:
+        return self.text[section.start:section.end]
+
+    def find(self, name: str) -> List[Section]:
+        wanted = normalize_section_name(name)
+        return [s for s in self.sections if s.name == wanted]
+
+    def outline(self) -> str:
+        return " / ".join(f"[{s.header}]" for s in self.sections)
+
+    def to_dict(self) -> Dict:
+        return {
+            "sections": [
+                {
+                    "header": s.header,
+                    "start": s.start,
+                    "end": s.end,
+                    "lines": [
+                        {
+                            "start": line.start,
+                            "end": line.end,
+                            "syllables": line.syllables,
+                            "tokens": [[t.start, t.end, t.syllables] for t in line.tokens],
+                        }
+                        for line in s.lines
+                    ],
+                }
+                for s in self.sections
+            ]
+        }
+
+
+def normalize_section_name(name: str) -> str:
+    return " ".join(name.strip().strip("[]").split()).upper()
+
+
+def estimate_syllables(word: str) -> int:
+    """Vowel-group syllable estimate for a single word."""
+    word = word.lower().replace("’", "'")
+    if word.isdigit():
+        return len(word)
+    if word.endswith("'s"):
+        word = word[:-2]
+    count = len(_VOWEL_GROUP_RE.findall(word))
+    if count > 1 and word.endswith("e") and not word.endswith(("le", "ee", "ye")):
+        count -= 1
+    return max(count, 1)
+
+
+def parse_lyrics(text: str, syllable_counter=estimate_syllables) -> ParsedLyrics:
+    """Parse lyrics into sections, lines and tokens in a single pass.
+
+    A section spans from its header line to the end of its last non-blank
+    line, so text outside every span (blank separators, preamble) can be
+    preserved byte-for-byte when a section is replaced. Lines before the
+    first header are not part of any section.
+    """
+    sections: List[Section] = []
+    header: Optional[str] = None
+    section_start = section_end = 0
+    lines: List[Line] = []
+    offset = 0
+
+    for raw in text.splitlines(keepends=True):
+        content = raw.rstrip("\r\n")
+        match = SECTION_HEADER_RE.match(content)
+        if match:
+            if header is not None:
+                sections.append(Section(header, section_start, section_end, tuple(lines)))
+            header = match.group(1).strip()
+            section_start, section_end = offset, offset + len(content)
+            lines = []
+        elif header is not None and content.strip():
+            tokens = tuple(
+                Token(offset + m.start(), offset + m.end(), syllable_counter(m.group()))
+                for m in WORD_RE.finditer(content)
+            )
+            lines.append(Line(offset, offset + len(content), tokens))
+            section_end = offset + len(content)
+        offset += len(raw)
+
+    if header is not None:
+        sections.append(Section(header, section_start, section_end, tuple(lines)))
+    return ParsedLyrics(text, tuple(sections))
+
+
+class ParseCache:
+    """Small LRU of parsed lyrics.
+
+    Callers that know the song pass ``(song_id, updated_at)`` as the key;
+    otherwise the key is a hash of the text itself.
+    """
+
+    def __init__(self, max_entries: int = 512, syllable_counter=estimate_syllables):
+        self.max_entries = max_entries
+        self.syllable_counter = syllable_counter
+        self._entries: "OrderedDict[Hashable, ParsedLyrics]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, key: Optional[Hashable] = None) -> ParsedLyrics:
+        if key is None:
+            key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        parsed = self._entries.get(key)
+        if parsed is not None and parsed.text == text:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return parsed
+        self.misses += 1
+        parsed = parse_lyrics(text, self.syllable_counter)
+        self._entries[key] = parsed
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return parsed
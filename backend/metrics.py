@@ -0,0 +1,228 @@
+"""Per-request stage timings, exposed as Prometheus histograms.
+
+``MetricsMiddleware`` opens a stage ledger for each HTTP request. Code on the
+hot path charges time to named stages (``auth``, ``prompt_build``,
+``llm_queue``, ``llm``, ``mongo_read``, ``mongo_write``, ``serialize``) with
+``stage()`` or ``timed()``; when the request finishes, each stage total is
+observed into a histogram labelled with the matched route template. Stages
+that run concurrently inside one request (parallel variations) add up, so a
+stage total can exceed the request's wall time.
+
+Outside a request (background tasks, workers) the timers are no-ops.
+Histograms are plain bucket counters, so recording costs one bisect and a
+few additions.
+"""
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "lyriclab_request_duration_seconds", "HTTP request duration by route.", ("route", "method", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "lyriclab_request_stage_seconds", "Time spent per request in each stage, by route.", ("route", "stage"),
+)
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS]
+
+
+def add_stage_time(name: str, seconds: float):
+    ledger = _stages.get()
+    if ledger is not None:
+        ledger[name] = ledger.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Charge the enclosed block's wall time to ``name`` for this request."""
+    if _stages.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    """Decorator form of ``stage`` for sync and async functions."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request duration and per-stage totals."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        ledger: Dict[str, float] = {}
+        token = _stages.set(ledger)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _stages.reset(token)
+            route = scope.get("route")
+            # The route template keeps label cardinality bounded
+            route_label = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route_label, scope["method"], str(status[0]))
+            for name, seconds in ledger.items():
+                STAGE_SECONDS.observe(seconds, route_label, name)
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---- Mongo timing ----
+
+MONGO_READS = frozenset({"find_one", "count_documents", "estimated_document_count", "distinct"})
+MONGO_WRITES = frozenset({
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete", "bulk_write", "create_index",
+})
+CURSOR_CHAIN = frozenset({"sort", "skip", "limit", "batch_size", "hint", "max_time_ms"})
+
+
+def _awaited(name: str, fn):
+    # Motor methods return futures rather than being coroutine functions,
+    # so time the await explicitly instead of relying on ``timed``.
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with stage(name):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+class TimedCursor:
+    """Cursor proxy charging ``to_list`` and iteration to ``mongo_read``."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._cursor, name)
+        if name in CURSOR_CHAIN:
+            return lambda *args, **kwargs: TimedCursor(attr(*args, **kwargs))
+        if name == "to_list":
+            return _awaited("mongo_read", attr)
+        return attr
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        with stage("mongo_read"):
+            return await self._cursor.__anext__()
+
+
+class TimedCollection:
+    """Collection proxy charging awaited calls to ``mongo_read``/``mongo_write``."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._collection, name)
+        if name in MONGO_READS:
+            return _awaited("mongo_read", attr)
+        if name in MONGO_WRITES:
+            return _awaited("mongo_write", attr)
+        if name in ("find", "aggregate"):
+            return lambda *args, **kwargs: TimedCursor(attr(*args, **kwargs))
+        return attr
+
+
+class TimedDatabase:
+    """Database proxy handing out ``TimedCollection`` views."""
+
+    def __init__(self, database):
+        self._database = database
+        self._collections: Dict[str, TimedCollection] = {}
+
+    def __getitem__(self, name: str) -> TimedCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = TimedCollection(self._database[name])
+        return collection
+
+    def __getattr__(self, name: str) -> TimedCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
@@ -0,0 +1,432 @@
+"""Prompt templates for the lyrics endpoints.
+
+Templates are compiled once at import into literal and field segments, so
+rendering is a single join. The spec-dependent blocks (the specification
+list, strictness sentence and short song context) are rendered from a
+``SpecFingerprint`` of the SongSpec and memoized, so repeated prompts for
+the same spec (six variations, retries, section edits) share one render.
+
+Layout is prefix-stable: static instructions, then the spec, then the
+volatile content, so upstream providers can cache the shared prefix.
+
+Run ``python benchmarks/bench_prompts.py`` for rendering throughput.
+"""
+from functools import lru_cache
+from string import Formatter
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from metrics import timed
+
+
+class PromptTemplate:
+    """A ``str.format``-style template parsed once into segments."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._segments: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if spec or conversion:
+                raise ValueError(f"Format specs are not supported in prompt templates: {field}")
+            self._segments.append((literal, field))
+        self.fields = frozenset(field for _, field in self._segments if field)
+
+    def render(self, **values: Any) -> str:
+        out = []
+        for literal, field in self._segments:
+            out.append(literal)
+            if field is not None:
+                out.append(str(values[field]))
+        return "".join(out)
+
+
+PERSPECTIVES = {
+    "I": "First person (I/me)",
+    "You": "Second person (you)",
+    "We": "First person plural (we)",
+    "3rd": "Third person (he/she/they)",
+}
+
+# (low cutoff, high cutoff, low, middle, high): below low, above high, else middle
+RHYME_VARIETY_BANDS = (30, 70, "repeat similar sounds", "moderate rhyme variety", "vary rhymes frequently")
+INTERNAL_RHYME_BANDS = (20, 80, "no internal rhymes", "some internal rhymes", "heavy internal rhyming")
+CADENCE_BANDS = (30, 70, "simple, steady rhythm", "moderate rhythmic variation", "syncopated, complex rhythms")
+WORD_CHOICE_BANDS = (30, 70, "plain, everyday language", "balanced vocabulary", "poetic, elevated vocabulary")
+DIRECTNESS_BANDS = (30, 70, "literal, direct meaning", "balance of literal and figurative", "abstract, metaphorical")
+STRICTNESS_BANDS = (
+    30, 70,
+    "Follow the specifications exactly. Do not deviate from the requested style, structure, or content.",
+    "Follow the specifications while allowing some creative interpretation where it improves the flow.",
+    "Use these specifications as a starting point but feel free to make creative additions that enhance the song while staying true to the theme.",
+)
+
+
+def band(value: int, bands: tuple) -> str:
+    low, high, low_desc, mid_desc, high_desc = bands
+    if value < low:
+        return low_desc
+    if value > high:
+        return high_desc
+    return mid_desc
+
+
+class SpecFingerprint(NamedTuple):
+    """Hashable snapshot of every SongSpec field that affects a prompt."""
+    title: str
+    topic: str
+    genre: str
+    subgenre: str
+    mood: str
+    custom_mood: str
+    perspective: str
+    structure: str
+    rhyme_scheme: str
+    rhyme_variety: Optional[int]
+    internal_rhyme_density: Optional[int]
+    cadence_complexity: Optional[int]
+    imagery_progression: bool
+    word_choice: Optional[int]
+    directness: Optional[int]
+    profanity: str
+    forbidden_words: Tuple[str, ...]
+    ai_freedom: Optional[int]
+    sample_lyrics: str
+
+
+def spec_fingerprint(spec: Any) -> SpecFingerprint:
+    return SpecFingerprint(
+        spec.title or "", spec.topic or "", spec.genre or "", spec.subgenre or "",
+        spec.mood or "", spec.custom_mood or "", spec.perspective or "", spec.structure or "",
+        spec.rhyme_scheme or "", spec.rhyme_variety, spec.internal_rhyme_density,
+        spec.cadence_complexity, bool(spec.imagery_progression), spec.word_choice, spec.directness,
+        spec.profanity or "", tuple(spec.forbidden_words or ()), spec.ai_freedom, spec.sample_lyrics or "",
+    )
+
+
+class RenderedSpec(NamedTuple):
+    spec_text: str  # Full specification list for generate/rewrite prompts
+    strictness: str  # How closely to follow the spec, from ai_freedom
+    title: str
+    topic: str
+    genre_line: str
+    mood: str
+
+
+@lru_cache(maxsize=1024)
+def _render_spec(fp: SpecFingerprint) -> RenderedSpec:
+    parts = []
+    if fp.title:
+        parts.append(f"Song Title: {fp.title}")
+    if fp.topic:
+        parts.append(f"Topic/Theme: {fp.topic}")
+    genre_str = fp.genre
+    if fp.subgenre:
+        genre_str = f"{fp.subgenre} ({fp.genre})" if genre_str else fp.subgenre
+    if genre_str:
+        parts.append(f"Genre: {genre_str}")
+    mood_str = fp.custom_mood or fp.mood
+    if mood_str:
+        parts.append(f"Mood/Emotion: {mood_str}")
+    if fp.perspective:
+        parts.append(f"Perspective: {PERSPECTIVES.get(fp.perspective, fp.perspective)}")
+    if fp.structure:
+        parts.append(f"Song Structure: {fp.structure}")
+    if fp.rhyme_scheme:
+        parts.append(f"Rhyme Scheme: {fp.rhyme_scheme}")
+    if fp.rhyme_variety is not None:
+        parts.append(f"Rhyme Variety: {band(fp.rhyme_variety, RHYME_VARIETY_BANDS)}")
+    if fp.internal_rhyme_density is not None:
+        parts.append(f"Internal Rhyme: {band(fp.internal_rhyme_density, INTERNAL_RHYME_BANDS)}")
+    if fp.cadence_complexity is not None:
+        parts.append(f"Cadence: {band(fp.cadence_complexity, CADENCE_BANDS)}")
+    if fp.imagery_progression:
+        parts.append("Imagery: Introduce new imagery as the song progresses, evolving the visual landscape")
+    if fp.word_choice is not None:
+        parts.append(f"Word Choice: {band(fp.word_choice, WORD_CHOICE_BANDS)}")
+    if fp.directness is not None:
+        parts.append(f"Style: {band(fp.directness, DIRECTNESS_BANDS)}")
+    if fp.profanity and fp.profanity != "None":
+        parts.append(f"Profanity: {fp.profanity} allowed")
+    if fp.forbidden_words:
+        parts.append(f"Forbidden words/phrases: {', '.join(fp.forbidden_words)}")
+    if fp.sample_lyrics:
+        parts.append(f"\nStyle Inspiration (write in a similar style to this):\n{fp.sample_lyrics}")
+
+    return RenderedSpec(
+        spec_text="\n".join(parts) if parts else "Write original song lyrics",
+        strictness=band(fp.ai_freedom or 50, STRICTNESS_BANDS),
+        title=fp.title or "Untitled",
+        topic=fp.topic or "General",
+        genre_line=f"{fp.genre or 'Any'} {('(' + fp.subgenre + ')') if fp.subgenre else ''}".rstrip(),
+        mood=fp.custom_mood or fp.mood or "Any",
+    )
+
+
+def render_spec(spec: Any) -> RenderedSpec:
+    """Spec blocks for ``spec``, memoized on its fingerprint."""
+    return _render_spec(spec_fingerprint(spec))
+
+
+# Every template puts static instructions first, then the per-song spec, and
+# the volatile content (current lyrics, user instruction, section name) last,
+# so consecutive calls share the longest possible prefix and upstream prompt
+# caching can reuse it.
+
+LYRICS_FORMAT = """Use section headers exactly like: [VERSE 1], [CHORUS], [VERSE 2], [BRIDGE], etc.
+Leave a blank line between sections.
+Do not include any explanations or commentary."""
+
+SPEC_BLOCK = """Song specifications:
+{spec_text}
+
+{strictness}"""
+
+SONG_CONTEXT = """Song context:
+Title: {title}
+Genre: {genre_line}
+Mood: {mood}"""
+
+GENERATE = PromptTemplate("""Write original song lyrics based on the specifications below.
+Output ONLY the lyrics. """ + LYRICS_FORMAT + """
+
+""" + SPEC_BLOCK)
+
+REWRITE_SONG = PromptTemplate("""Rewrite the song given at the end while maintaining its core essence and theme.
+Output ONLY the lyrics. """ + LYRICS_FORMAT + """
+
+""" + SPEC_BLOCK + """
+
+Current lyrics:
+{lyrics}""")
+
+REWRITE_SECTION_IN_SONG = PromptTemplate("""Rewrite ONLY one section of the song given at the end; the section is named below.
+Output ONLY the complete song lyrics with that section rewritten. Keep all other sections exactly as they are.
+""" + LYRICS_FORMAT + """
+
+""" + SPEC_BLOCK + """
+
+Section to rewrite: {section}{rhyme_instruction}
+
+Current lyrics:
+{lyrics}""")
+
+REWRITE_SECTION_SCOPED = PromptTemplate("""Rewrite ONLY the song section given at the end.
+Output ONLY the rewritten section, starting with its section header.
+Do not include any other sections, explanations or commentary.
+
+""" + SPEC_BLOCK + """
+
+Song outline: {outline}
+Section to rewrite: {section}{rhyme_instruction}
+
+Current {section}:
+{lyrics}""")
+
+SECTION_VARIATION = PromptTemplate("""Generate an alternative version of one section of the song given at the end; the section is named below.
+Make it distinctly different from the original while keeping the same theme.
+Output ONLY that section's lyrics, nothing else, starting with its section header.
+
+Song specifications:
+Title: {title}
+Topic: {topic}
+Genre: {genre_line}
+Mood: {mood}
+
+Section: {section} (header [{section_header}]){rhyme_instruction}
+
+Current lyrics:
+{lyrics}""")
+
+SONG_VARIATION = PromptTemplate("""Write original song lyrics based on the specifications below.
+Create a fresh, creative version that explores the theme differently.
+Output ONLY the lyrics. """ + LYRICS_FORMAT + """
+
+""" + SPEC_BLOCK)
+
+CUSTOM_EDIT_SCOPED = PromptTemplate("""Edit the song section given at the end by following the user's instruction.
+Apply the instruction to this section only.
+Output ONLY the edited section, starting with its section header.
+Do not include any other sections or explanations.
+
+""" + SONG_CONTEXT + """
+
+Song outline: {outline}
+
+USER INSTRUCTION: {instruction}
+
+Current {section}:
+{lyrics}""")
+
+CUSTOM_EDIT_SECTION = PromptTemplate("""Edit one section of the song given at the end by following the user's instruction; the section is named below.
+IMPORTANT: Apply the instruction ONLY to that section. Keep all other sections exactly as they are.
+Output the COMPLETE song with all sections, with only that section modified.
+Use section headers like [VERSE 1], [CHORUS], [BRIDGE], etc.
+Do not include any explanations.
+
+""" + SONG_CONTEXT + """
+
+Section to edit: {section}
+
+USER INSTRUCTION: {instruction}
+
+Current full lyrics:
+{lyrics}""")
+
+CUSTOM_EDIT_SONG = PromptTemplate("""Edit the song given at the end by following the user's instruction to improve it.
+Use section headers like [VERSE 1], [CHORUS], [BRIDGE], etc.
+Output ONLY the edited lyrics, no explanations.
+
+""" + SONG_CONTEXT + """
+
+USER INSTRUCTION: {instruction}
+
+Current lyrics:
+{lyrics}""")
+
+TRANSFORM = PromptTemplate("""Transform the lyrics given at the end while preserving their musical qualities.
+
+IMPORTANT GUIDELINES:
+- Each new line should have the same number of syllables as the original line it replaces
+- Rhyming words should rhyme in the same positions as the original
+- The "singability" and flow must match the original
+- Use section headers like [VERSE 1], [CHORUS], [BRIDGE], etc.
+
+Output ONLY the transformed lyrics, no explanations.
+
+WHAT TO PRESERVE:
+- {preserve_text}
+
+WHAT TO CHANGE:
+- {change_text}
+{additional}
+
+ORIGINAL LYRICS:
+{lyrics}""")
+
+REPAIR_LINES = PromptTemplate("""Fix the numbered song lines given at the end so they meet their requirements while keeping their meaning and the song's new theme.
+Output exactly one line per item, formatted as "<number>: <fixed line>".
+Do not include any explanations.
+
+{items}""")
+
+REPAIR_ITEM = PromptTemplate("""{number}. [{header}] line {line_number}
+   Original: {original}
+   Current: {current}
+   Requirement: {requirements}""")
+
+
+class RepairItem(NamedTuple):
+    header: str
+    line_index: int
+    original: str
+    current: str
+    requirements: List[str]
+
+
+@timed("prompt_build")
+def build_lyrics_prompt(spec: Any, rewrite_lyrics: str = None, section_to_rewrite: str = None, section_rhyme_scheme: str = None, song_outline: str = None) -> str:
+    """Build the prompt for lyrics generation."""
+    rendered = render_spec(spec)
+
+    if section_to_rewrite and rewrite_lyrics:
+        # Section-scoped when an outline is given: rewrite_lyrics holds only the target section
+        template = REWRITE_SECTION_SCOPED if song_outline else REWRITE_SECTION_IN_SONG
+        rhyme_instruction = ""
+        if section_rhyme_scheme:
+            rhyme_instruction = f"\nIMPORTANT: Use {section_rhyme_scheme} rhyme scheme for this {section_to_rewrite}."
+        return template.render(
+            section=section_to_rewrite,
+            lyrics=rewrite_lyrics,
+            outline=song_outline,
+            spec_text=rendered.spec_text,
+            rhyme_instruction=rhyme_instruction,
+            strictness=rendered.strictness,
+        )
+
+    if rewrite_lyrics:
+        return REWRITE_SONG.render(lyrics=rewrite_lyrics, spec_text=rendered.spec_text, strictness=rendered.strictness)
+
+    return GENERATE.render(spec_text=rendered.spec_text, strictness=rendered.strictness)
+
+
+@timed("prompt_build")
+def build_variation_prompt(spec: Any, current_lyrics: str, section: Optional[str], section_rhyme_scheme: Optional[str]) -> str:
+    rendered = render_spec(spec)
+    if not section:
+        return SONG_VARIATION.render(spec_text=rendered.spec_text, strictness=rendered.strictness)
+    rhyme_instruction = ""
+    if section_rhyme_scheme:
+        rhyme_instruction = f"\nIMPORTANT: Use {section_rhyme_scheme} rhyme scheme for this section."
+    return SECTION_VARIATION.render(
+        section=section,
+        section_header=section.upper(),
+        lyrics=current_lyrics,
+        title=rendered.title,
+        topic=rendered.topic,
+        genre_line=rendered.genre_line,
+        mood=rendered.mood,
+        rhyme_instruction=rhyme_instruction,
+    )
+
+
+@timed("prompt_build")
+def build_custom_edit_prompt(spec: Any, instruction: str, lyrics: str, section: Optional[str] = None, outline: Optional[str] = None) -> str:
+    """Custom-edit prompt; with ``outline``, ``lyrics`` is just the target section."""
+    if section and outline:
+        template = CUSTOM_EDIT_SCOPED
+    elif section:
+        template = CUSTOM_EDIT_SECTION
+    else:
+        template = CUSTOM_EDIT_SONG
+    rendered = render_spec(spec)
+    return template.render(
+        section=section,
+        instruction=instruction,
+        lyrics=lyrics,
+        outline=outline,
+        title=rendered.title,
+        genre_line=rendered.genre_line,
+        mood=rendered.mood,
+    )
+
+
+@timed("prompt_build")
+def build_transform_prompt(request: Any) -> str:
+    """Transform prompt from a TransformLyricsRequest."""
+    preserve = []
+    if request.keep_cadence:
+        preserve.append("PRESERVE the exact rhythm, cadence, and syllable patterns of each line")
+    if request.keep_rhyme_scheme:
+        preserve.append("PRESERVE the exact rhyme scheme and rhyme positions")
+    if request.keep_structure:
+        preserve.append("PRESERVE the exact song structure (same sections, same number of lines per section)")
+
+    change = []
+    if request.new_topic:
+        change.append(f"Change the TOPIC/SUBJECT to: {request.new_topic}")
+    if request.new_mood:
+        change.append(f"Change the MOOD/EMOTION to: {request.new_mood}")
+    if request.new_genre:
+        change.append(f"Adapt the STYLE to fit: {request.new_genre} genre")
+
+    return TRANSFORM.render(
+        preserve_text="\n- ".join(preserve) if preserve else "You may adjust structure as needed",
+        change_text="\n- ".join(change) if change else "Improve and refine the lyrics",
+        additional=f"\nAdditional instructions: {request.additional_instructions}" if request.additional_instructions else "",
+        lyrics=request.current_lyrics,
+    )
+
+
+@timed("prompt_build")
+def build_repair_prompt(items: List[RepairItem]) -> str:
+    """Line-repair prompt; the model answers item ``n`` as ``"n: <line>"``."""
+    return REPAIR_LINES.render(items="\n".join(
+        REPAIR_ITEM.render(
+            number=number,
+            header=item.header,
+            line_number=item.line_index + 1,
+            original=item.original,
+            current=item.current,
+            requirements="; ".join(item.requirements),
+        )
+        for number, item in enumerate(items, start=1)
+    ))
@@ -0,0 +1,308 @@
+"""Offline syllable and rhyme analysis for lyrics.
+
+Per-word syllable counts and end-rhyme keys come from a precomputed
+pronunciation table (compiled from the CMU Pronouncing Dictionary) that is
+memory-mapped and searched in place, so loading it costs nothing and lookups
+allocate little. Words missing from the table fall back to spelling-based
+estimates. Analysing a full song takes a few milliseconds.
+
+Build the table ahead of deploys with ``python prosody.py build``; if it is
+missing at runtime it is built once from the ``cmudict`` package.
+"""
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from lyrics_parser import ParseCache, ParsedLyrics, Section, estimate_syllables
+
+logger = logging.getLogger(__name__)
+
+TABLE_PATH = Path(os.environ.get(
+    "PRONUNCIATION_TABLE", Path(__file__).parent / "data" / "pronunciations.bin"
+))
+
+# magic, version, word count, rhyme key count, words blob size, rhyme blob size
+_HEADER = struct.Struct("<4sIIIII")
+_MAGIC = b"LLPT"
+_VERSION = 1
+
+_PHONE_RE = re.compile(r"^[A-Z]+[012]?$")
+_ORTHO_RHYME_RE = re.compile(r"[aeiouy]+[^aeiouy]*$")
+
+
+def rhyme_key_from_phones(phones: List[str]) -> str:
+    """Phones from the last stressed vowel to the end, stress marks removed."""
+    vowels = [i for i, p in enumerate(phones) if p[-1].isdigit()]
+    if not vowels:
+        return " ".join(phones)
+    stressed = [i for i in vowels if phones[i][-1] in "12"]
+    start = stressed[-1] if stressed else vowels[-1]
+    return " ".join(p.rstrip("012") for p in phones[start:])
+
+
+def build_table(out_path: Path = TABLE_PATH) -> Path:
+    """Compile the CMU dictionary into the binary table at ``out_path``."""
+    import cmudict
+
+    entries: Dict[bytes, Tuple[int, str]] = {}
+    for word, phones in cmudict.entries():
+        phones = [p for p in phones if _PHONE_RE.match(p)]
+        key = word.lower().encode("utf-8")
+        if not phones or key in entries:
+            continue
+        syllables = sum(1 for p in phones if p[-1].isdigit())
+        entries[key] = (min(max(syllables, 1), 255), rhyme_key_from_phones(phones))
+
+    words = sorted(entries)
+    rhyme_ids: Dict[str, int] = {}
+    for word in words:
+        rhyme_ids.setdefault(entries[word][1], len(rhyme_ids))
+    rhymes = [r.encode("ascii") for r in rhyme_ids]
+
+    def offsets(items: List[bytes]) -> bytes:
+        out, pos = [0], 0
+        for item in items:
+            pos += len(item)
+            out.append(pos)
+        return struct.pack(f"<{len(out)}I", *out)
+
+    words_blob = b"".join(words)
+    rhymes_blob = b"".join(rhymes)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(words), len(rhymes), len(words_blob), len(rhymes_blob)))
+        f.write(offsets(words))
+        f.write(offsets(rhymes))
+        f.write(struct.pack(f"<{len(words)}I", *(rhyme_ids[entries[w][1]] for w in words)))
+        f.write(bytes(entries[w][0] for w in words))
+        f.write(words_blob)
+        f.write(rhymes_blob)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class PronunciationTable:
+    """Memory-mapped, binary-searched view of the compiled table."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_words, n_rhymes, words_len, rhymes_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Unsupported pronunciation table at {path}")
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+        self._word_offsets = view[pos:pos + 4 * (n_words + 1)].cast("I")
+        pos += 4 * (n_words + 1)
+        self._rhyme_offsets = view[pos:pos + 4 * (n_rhymes + 1)].cast("I")
+        pos += 4 * (n_rhymes + 1)
+        self._rhyme_ids = view[pos:pos + 4 * n_words].cast("I")
+        pos += 4 * n_words
+        self._syllables = view[pos:pos + n_words]
+        pos += n_words
+        self._words = view[pos:pos + words_len]
+        pos += words_len
+        self._rhymes = view[pos:pos + rhymes_len]
+        self.size = n_words
+
+    def _index(self, word: bytes) -> int:
+        lo, hi = 0, self.size
+        offsets, blob = self._word_offsets, self._words
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = blob[offsets[mid]:offsets[mid + 1]].tobytes()
+            if candidate < word:
+                lo = mid + 1
+            elif candidate > word:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def lookup(self, word: str) -> Optional[Tuple[int, str]]:
+        index = self._index(word.encode("utf-8"))
+        if index < 0:
+            return None
+        rhyme_id = self._rhyme_ids[index]
+        rhyme = self._rhymes[self._rhyme_offsets[rhyme_id]:self._rhyme_offsets[rhyme_id + 1]].tobytes()
+        return self._syllables[index], rhyme.decode("ascii")
+
+
+_table: Optional[PronunciationTable] = None
+_table_loaded = False
+
+
+def get_table() -> Optional[PronunciationTable]:
+    """Load the table once per process; None if it cannot be found or built."""
+    global _table, _table_loaded
+    if not _table_loaded:
+        _table_loaded = True
+        try:
+            if not TABLE_PATH.exists():
+                build_table(TABLE_PATH)
+            _table = PronunciationTable(TABLE_PATH)
+        except Exception as e:
+            logger.warning(f"Pronunciation table unavailable, using spelling estimates: {e}")
+            _table = None
+    return _table
+
+
+def _ortho_rhyme_key(word: str) -> str:
+    match = _ORTHO_RHYME_RE.search(word)
+    return "~" + (match.group() if match else word)
+
+
+@lru_cache(maxsize=50000)
+def word_profile(word: str) -> Tuple[int, str]:
+    """``(syllables, rhyme_key)`` for a word."""
+    word = word.lower().replace("’", "'")
+    table = get_table()
+    found = table.lookup(word) if table is not None else None
+    if found is not None:
+        return found
+    return estimate_syllables(word), _ortho_rhyme_key(word)
+
+
+def syllable_count(word: str) -> int:
+    return word_profile(word)[0]
+
+
+# Shared parse cache; token syllables use the same counts as the analysis.
+parse_cache = ParseCache(syllable_counter=syllable_count)
+
+
+class LineProfile(NamedTuple):
+    syllables: int
+    rhyme_key: Optional[str]
+
+
+def profile_section(parsed: ParsedLyrics, section: Section) -> List[LineProfile]:
+    text = parsed.text
+    profiles = []
+    for line in section.lines:
+        syllables = 0
+        rhyme_key = None
+        for token in line.tokens:
+            count, rhyme_key = word_profile(text[token.start:token.end])
+            syllables += count
+        profiles.append(LineProfile(syllables, rhyme_key))
+    return profiles
+
+
+def rhyme_scheme(profiles: List[LineProfile]) -> str:
+    """Letter scheme (e.g. ``AABB``) from end-rhyme keys; ``X`` for no words."""
+    letters: Dict[str, str] = {}
+    scheme = []
+    for profile in profiles:
+        if profile.rhyme_key is None:
+            scheme.append("X")
+            continue
+        if profile.rhyme_key not in letters:
+            letters[profile.rhyme_key] = chr(ord("A") + len(letters) % 26)
+        scheme.append(letters[profile.rhyme_key])
+    return "".join(scheme)
+
+
+def analyze_lyrics(lyrics: str, parsed: Optional[ParsedLyrics] = None) -> Dict:
+    """Per-section line syllable counts, rhyme keys and detected scheme."""
+    parsed = parsed or parse_cache.get(lyrics)
+    sections = []
+    for section in parsed.sections:
+        profiles = profile_section(parsed, section)
+        sections.append({
+            "header": section.header,
+            "rhyme_scheme": rhyme_scheme(profiles),
+            "syllables": [p.syllables for p in profiles],
+            "rhyme_keys": [p.rhyme_key for p in profiles],
+        })
+    return {"sections": sections}
+
+
+def broken_rhymes(original_keys: List[Optional[str]], revised_keys: List[Optional[str]]) -> Set[int]:
+    """Lines that no longer rhyme with their partners from the original.
+
+    Lines are grouped by the original's end-rhyme keys. Within each group the
+    revised key shared by most members (earliest line on ties) is taken as the
+    group's rhyme; members ending on anything else are broken. Judging groups
+    rather than scheme letters keeps one changed line from renaming, and so
+    flagging, every letter after it.
+    """
+    groups: Dict[str, List[int]] = {}
+    for line, key in enumerate(original_keys[:len(revised_keys)]):
+        if key is not None:
+            groups.setdefault(key, []).append(line)
+    broken = set()
+    for lines in groups.values():
+        if len(lines) < 2:
+            continue
+        votes: Dict[Optional[str], int] = {}
+        for line in lines:
+            votes[revised_keys[line]] = votes.get(revised_keys[line], 0) + 1
+        # dicts keep insertion order, so max() settles ties on the earliest line
+        anchor = max(votes, key=votes.get)
+        broken.update(line for line in lines if anchor is None or revised_keys[line] != anchor)
+    return broken
+
+
+def compare_lyrics(original: str, revised: str, syllable_tolerance: int = 1) -> Dict:
+    """Score revised lyrics against the original's cadence and rhyme scheme.
+
+    Sections are paired in order and lines by position. A line keeps cadence
+    if its syllable count is within ``syllable_tolerance`` of the original;
+    a section keeps its rhyme scheme if the letter patterns are equal, and a
+    line keeps its rhyme unless ``broken_rhymes`` reports it.
+    """
+    before = analyze_lyrics(original)["sections"]
+    after = analyze_lyrics(revised)["sections"]
+    issues = []
+    lines_checked = lines_matching = 0
+    schemes_matching = 0
+
+    for index, (old, new) in enumerate(zip(before, after)):
+        if old["rhyme_scheme"] == new["rhyme_scheme"]:
+            schemes_matching += 1
+        broken = broken_rhymes(old["rhyme_keys"], new["rhyme_keys"])
+        for line, (old_count, new_count) in enumerate(zip(old["syllables"], new["syllables"])):
+            lines_checked += 1
+            rhyme_ok = line not in broken
+            cadence_ok = abs(old_count - new_count) <= syllable_tolerance
+            if cadence_ok:
+                lines_matching += 1
+            if not (cadence_ok and rhyme_ok):
+                issues.append({
+                    "section_index": index,
+                    "header": new["header"],
+                    "line_index": line,
+                    "original_syllables": old_count,
+                    "syllables": new_count,
+                    "cadence_ok": cadence_ok,
+                    "rhyme_ok": rhyme_ok,
+                })
+
+    structure_ok = len(before) == len(after) and all(
+        len(old["syllables"]) == len(new["syllables"]) for old, new in zip(before, after)
+    )
+    paired = min(len(before), len(after))
+    return {
+        "structure_ok": structure_ok,
+        "cadence_score": round(lines_matching / lines_checked, 3) if lines_checked else 1.0,
+        "rhyme_scheme_score": round(schemes_matching / paired, 3) if paired else 1.0,
+        "original_schemes": [s["rhyme_scheme"] for s in before],
+        "schemes": [s["rhyme_scheme"] for s in after],
+        "issues": issues,
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["build"]:
+        print(f"Wrote {build_table(Path(sys.argv[2]) if len(sys.argv) > 2 else TABLE_PATH)}")
+    else:
+        print("usage: python prosody.py build [out_path]")
@@ -1,17 +1,40 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple, NamedTuple, Callable
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
 import uuid
+import contextvars
+import time
+import asyncio
+import re
+import json
+import hashlib
+import math
+import random
+import base64
+import difflib
+from email.utils import format_datetime
 from datetime import datetime, timezone, timedelta
 import httpx
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+import litellm
+from openai import AsyncOpenAI
+from lyrics_parser import SECTION_HEADER_RE, Section
+from http_encoding import CompressionMiddleware, FastJSONResponse, fast_json
+from metrics import MetricsMiddleware, TimedDatabase, add_stage_time, render_prometheus, stage, timed
+from prompts import build_lyrics_prompt
+import prompts
+import prosody
+from prosody import parse_cache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -19,7 +42,8 @@ load_dotenv(ROOT_DIR / '.env')
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Awaited collection calls are charged to the request's mongo_read/mongo_write stages
+db = TimedDatabase(client[os.environ['DB_NAME']])
 
 # Create the main app
 app = FastAPI()
@@ -94,6 +118,13 @@ class SongUpdate(BaseModel):
     status: Optional[str] = None
     used_in_final_track: Optional[bool] = None
 
+class SongPatch(BaseModel):
+    base_version: int  # lyrics_version the ops were computed against
+    ops: List[Tuple[int, int, List[str]]] = []  # [start, end, lines] replacing base lines[start:end]
+    title: Optional[str] = None
+    status: Optional[str] = None
+    used_in_final_track: Optional[bool] = None
+
 class GenerateLyricsRequest(BaseModel):
     song_spec: SongSpec
 
@@ -129,9 +160,93 @@ class TransformLyricsRequest(BaseModel):
     keep_rhyme_scheme: bool = True
     keep_structure: bool = True
     additional_instructions: Optional[str] = None
+    repair: bool = False  # Re-request only lines that break kept cadence/rhyme
+    max_repair_lines: int = 6
+
+class AnalyzeLyricsRequest(BaseModel):
+    current_lyrics: str
+    original_lyrics: Optional[str] = None  # If set, score current_lyrics against it
+
+class LyricsJobCreate(BaseModel):
+    kind: str  # generate, rewrite, rewrite-section, variations, custom-edit or transform
+    request: Dict[str, Any]  # Body the matching /api/lyrics/* endpoint takes
+
+# ============ SESSION CACHE ============
+
+class SessionCache:
+    """Bounded TTL/LRU cache of resolved sessions keyed by session token.
+
+    Each entry holds the resolved User and is never kept past the session's
+    real expiry, so a cached hit can skip both Mongo lookups safely.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, session_token: str) -> Optional[User]:
+        entry = self._entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, deadline = entry
+        if deadline <= time.time():
+            del self._entries[session_token]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_token)
+        self.hits += 1
+        return user
+
+    def put(self, session_token: str, user: User, expires_at: datetime):
+        if self.max_entries <= 0:
+            return
+        deadline = min(time.time() + self.ttl_seconds, expires_at.timestamp())
+        self._entries[session_token] = (user, deadline)
+        self._entries.move_to_end(session_token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, session_token: str):
+        if self._entries.pop(session_token, None) is not None:
+            self.invalidations += 1
+
+    def invalidate_user(self, user_id: str):
+        stale = [token for token, (user, _) in self._entries.items() if user.user_id == user_id]
+        for token in stale:
+            del self._entries[token]
+        self.invalidations += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+session_cache = SessionCache(
+    max_entries=int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "60")),
+)
 
 # ============ AUTH HELPERS ============
 
+@timed("auth")
 async def get_current_user(request: Request) -> User:
     """Extract user from session token in cookie or Authorization header."""
     session_token = request.cookies.get("session_token")
@@ -144,6 +259,10 @@ async def get_current_user(request: Request) -> User:
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    cached_user = session_cache.get(session_token)
+    if cached_user is not None:
+        return cached_user
+    
     session_doc = await db.user_sessions.find_one(
         {"session_token": session_token},
         {"_id": 0}
@@ -168,7 +287,17 @@ async def get_current_user(request: Request) -> User:
     if not user_doc:
         raise HTTPException(status_code=401, detail="User not found")
     
-    return User(**user_doc)
+    user = User(**user_doc)
+    session_cache.put(session_token, user, expires_at)
+    return user
+
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+async def require_admin(user: User = Depends(get_current_user)) -> User:
+    """Allow only users whose email is listed in ADMIN_EMAILS."""
+    if user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
 
 # ============ AUTH ENDPOINTS ============
 
@@ -204,6 +333,7 @@ async def create_session(request: Request, response: Response):
                 "picture": user_data.get("picture")
             }}
         )
+        session_cache.invalidate_user(user_id)
     else:
         await db.users.insert_one({
             "user_id": user_id,
@@ -219,7 +349,7 @@ async def create_session(request: Request, response: Response):
     await db.user_sessions.insert_one({
         "session_token": session_token,
         "user_id": user_id,
-        "expires_at": expires_at.isoformat(),
+        "expires_at": expires_at,  # BSON date, so the TTL index can reap it
         "created_at": datetime.now(timezone.utc).isoformat()
     })
     
@@ -247,6 +377,7 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     
     if session_token:
+        session_cache.invalidate(session_token)
         await db.user_sessions.delete_one({"session_token": session_token})
     
     response.delete_cookie(key="session_token", path="/")
@@ -254,196 +385,1296 @@ async def logout(request: Request, response: Response):
 
 # ============ LYRICS GENERATION ============
 
-def build_lyrics_prompt(spec: SongSpec, rewrite_lyrics: str = None, section_to_rewrite: str = None, section_rhyme_scheme: str = None) -> str:
-    """Build the prompt for lyrics generation."""
-    
-    prompt_parts = []
-    
-    # Title
-    if spec.title:
-        prompt_parts.append(f"Song Title: {spec.title}")
-    
-    # Topic
-    if spec.topic:
-        prompt_parts.append(f"Topic/Theme: {spec.topic}")
-    
-    # Genre
-    genre_str = spec.genre or ""
-    if spec.subgenre:
-        genre_str = f"{spec.subgenre} ({spec.genre})" if genre_str else spec.subgenre
-    if genre_str:
-        prompt_parts.append(f"Genre: {genre_str}")
-    
-    # Mood
-    mood_str = spec.custom_mood if spec.custom_mood else spec.mood
-    if mood_str:
-        prompt_parts.append(f"Mood/Emotion: {mood_str}")
-    
-    # Perspective
-    if spec.perspective:
-        perspectives = {
-            "I": "First person (I/me)",
-            "You": "Second person (you)",
-            "We": "First person plural (we)",
-            "3rd": "Third person (he/she/they)"
+def find_section_targets(lyrics: str, section: str):
+    """Find the sections an edit applies to.
+
+    Returns ``(section_text, targets, parsed)`` or None if the section is
+    not in the lyrics. Repeats of the section whose text is identical to the
+    first copy (e.g. every chorus) are edited together so they stay in sync.
+    """
+    parsed = parse_cache.get(lyrics)
+    matches = parsed.find(section)
+    if not matches:
+        return None
+    section_text = parsed.section_text(matches[0])
+    targets = [m for m in matches if parsed.section_text(m) == section_text]
+    return section_text, targets, parsed
+
+def extract_section_body(output: str) -> str:
+    """Body lines of the first section in model output, header removed."""
+    lines = output.strip().strip("`").strip().splitlines()
+    if lines and SECTION_HEADER_RE.match(lines[0]):
+        lines = lines[1:]
+    body = []
+    for line in lines:
+        if SECTION_HEADER_RE.match(line):
+            break
+        body.append(line.rstrip())
+    while body and not body[-1].strip():
+        body.pop()
+    while body and not body[0].strip():
+        body.pop(0)
+    return "\n".join(body)
+
+def splice_section(lyrics: str, targets: List[Section], body: str) -> str:
+    """Replace the body of each target section, leaving all other text as is."""
+    newline = "\r\n" if "\r\n" in lyrics else "\n"
+    body = body.replace("\n", newline)
+    pieces = []
+    cursor = 0
+    for section in targets:
+        header_line = lyrics[section.start:].split("\n", 1)[0].rstrip("\r")
+        pieces.append(lyrics[cursor:section.start])
+        pieces.append(header_line + newline + body)
+        cursor = section.end
+    pieces.append(lyrics[cursor:])
+    return "".join(pieces)
+
+class LLMUsage(NamedTuple):
+    endpoint: Optional[str]
+    model: str
+    input_tokens: Optional[int]  # None when the transport does not report usage
+    cached_input_tokens: Optional[int]
+    output_tokens: Optional[int]
+    latency_seconds: float
+    user_id: Optional[str] = None
+    estimated: bool = False  # token counts computed locally, cache hits unknown
+
+def usage_counts(usage: Any) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """``(input, cached input, output)`` tokens from a provider usage block."""
+    if usage is None:
+        return None, None, None
+    
+    def get(obj, name):
+        if obj is None:
+            return None
+        return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+    
+    input_tokens = get(usage, "prompt_tokens")
+    # OpenAI reports prompt_tokens_details.cached_tokens, Anthropic cache_read_input_tokens
+    cached = get(get(usage, "prompt_tokens_details"), "cached_tokens")
+    if cached is None:
+        cached = get(usage, "cache_read_input_tokens")
+    if input_tokens is not None and cached is None:
+        cached = 0
+    return input_tokens, cached, get(usage, "completion_tokens")
+
+LYRICIST_SYSTEM_MESSAGE = "You are a professional songwriter and lyricist. You write compelling, creative, and emotionally resonant song lyrics. You follow formatting instructions precisely."
+
+# The Emergent universal key is not a provider key: LlmChat sends it to
+# Emergent's OpenAI-compatible integration proxy. The gateway resolves the
+# same endpoint so it can call it directly over its own pooled client.
+UNIVERSAL_KEY_PREFIX = "sk-emergent-"
+INTEGRATION_PROXY_URL = os.environ.get("INTEGRATION_PROXY_URL", "https://integrations.emergentagent.com")
+
+def resolve_llm_endpoint(api_key: Optional[str], api_base: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """``(api_base, custom_llm_provider)`` for litellm.
+
+    An explicit ``LLM_API_BASE`` wins; a universal key goes to the
+    integration proxy; any other key goes to the provider's own API.
+    """
+    if api_base:
+        return api_base, None
+    if api_key and api_key.startswith(UNIVERSAL_KEY_PREFIX):
+        return f"{INTEGRATION_PROXY_URL.rstrip('/')}/llm", "openai"
+    return None, None
+
+class LLMGateway:
+    """Long-lived LLM client shared by every lyrics endpoint.
+
+    Created once at startup and closed on shutdown. The API key, model and
+    endpoint are resolved once, and every completion goes through litellm
+    with one ``AsyncOpenAI`` client bound to the gateway's pooled
+    ``httpx.AsyncClient``, so connections (and TLS sessions) are reused
+    across requests. Token usage, including provider prompt-cache hits, is
+    reported to ``usage_hooks``.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        provider: str = "openai",
+        model: str = "gpt-5.2",
+        system_message: str = LYRICIST_SYSTEM_MESSAGE,
+        api_base: Optional[str] = None,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+    ):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+        self.system_message = system_message
+        self.api_base, self.custom_llm_provider = resolve_llm_endpoint(api_key, api_base)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.client: Optional[AsyncOpenAI] = None
+        self.usage_hooks: List[Callable[[LLMUsage], None]] = []
+
+    def add_usage_hook(self, hook: Callable[[LLMUsage], None]):
+        self.usage_hooks.append(hook)
+
+    def _count_tokens(self, messages: List[Dict[str, str]], output: str) -> Tuple[Optional[int], Optional[int]]:
+        try:
+            return (
+                litellm.token_counter(model=self.model, messages=messages),
+                litellm.token_counter(model=self.model, text=output),
+            )
+        except Exception as e:
+            logger.warning(f"Could not count tokens for {self.model}: {e}")
+            return None, None
+
+    def _report_usage(
+        self, endpoint: Optional[str], user_id: Optional[str], usage: Any, started: float,
+        messages: List[Dict[str, str]], output: str,
+    ):
+        input_tokens, cached, output_tokens = usage_counts(usage)
+        estimated = False
+        if input_tokens is None:
+            # No usage block from upstream: count locally so metering still
+            # sees the call's tokens
+            input_tokens, output_tokens = self._count_tokens(messages, output)
+            estimated = input_tokens is not None
+        record = LLMUsage(
+            endpoint, self.model, input_tokens, cached, output_tokens, time.monotonic() - started, user_id, estimated
+        )
+        for hook in self.usage_hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                logger.warning(f"LLM usage hook failed: {e}")
+
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        # System message first and prompt last keeps the cacheable prefix stable
+        return [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": prompt},
+        ]
+
+    def _completion_args(self, prompt: str, temperature: float) -> Dict[str, Any]:
+        args = {
+            "model": f"{self.provider}/{self.model}",
+            "messages": self._messages(prompt),
+            "api_key": self.api_key,
+            "temperature": temperature,
+            # Some models only accept their default temperature
+            "drop_params": True,
         }
-        prompt_parts.append(f"Perspective: {perspectives.get(spec.perspective, spec.perspective)}")
-    
-    # Structure
-    if spec.structure:
-        prompt_parts.append(f"Song Structure: {spec.structure}")
-    
-    # Rhyme scheme
-    if spec.rhyme_scheme:
-        prompt_parts.append(f"Rhyme Scheme: {spec.rhyme_scheme}")
-    
-    # Rhyme variety
-    if spec.rhyme_variety is not None:
-        variety_desc = "repeat similar sounds" if spec.rhyme_variety < 30 else "vary rhymes frequently" if spec.rhyme_variety > 70 else "moderate rhyme variety"
-        prompt_parts.append(f"Rhyme Variety: {variety_desc}")
-    
-    # Internal rhyme density
-    if spec.internal_rhyme_density is not None:
-        density_desc = "no internal rhymes" if spec.internal_rhyme_density < 20 else "heavy internal rhyming" if spec.internal_rhyme_density > 80 else "some internal rhymes"
-        prompt_parts.append(f"Internal Rhyme: {density_desc}")
-    
-    # Cadence complexity
-    if spec.cadence_complexity is not None:
-        cadence_desc = "simple, steady rhythm" if spec.cadence_complexity < 30 else "syncopated, complex rhythms" if spec.cadence_complexity > 70 else "moderate rhythmic variation"
-        prompt_parts.append(f"Cadence: {cadence_desc}")
-    
-    # Imagery progression
-    if spec.imagery_progression:
-        prompt_parts.append("Imagery: Introduce new imagery as the song progresses, evolving the visual landscape")
-    
-    # Word choice
-    if spec.word_choice is not None:
-        word_desc = "plain, everyday language" if spec.word_choice < 30 else "poetic, elevated vocabulary" if spec.word_choice > 70 else "balanced vocabulary"
-        prompt_parts.append(f"Word Choice: {word_desc}")
-    
-    # Directness
-    if spec.directness is not None:
-        direct_desc = "literal, direct meaning" if spec.directness < 30 else "abstract, metaphorical" if spec.directness > 70 else "balance of literal and figurative"
-        prompt_parts.append(f"Style: {direct_desc}")
-    
-    # Profanity
-    if spec.profanity and spec.profanity != "None":
-        prompt_parts.append(f"Profanity: {spec.profanity} allowed")
-    
-    # Forbidden words
-    if spec.forbidden_words:
-        prompt_parts.append(f"Forbidden words/phrases: {', '.join(spec.forbidden_words)}")
-    
-    # Sample lyrics as inspiration
-    if spec.sample_lyrics:
-        prompt_parts.append(f"\nStyle Inspiration (write in a similar style to this):\n{spec.sample_lyrics}")
-    
-    # Build the main prompt
-    spec_text = "\n".join(prompt_parts) if prompt_parts else "Write original song lyrics"
-    
-    # Determine strictness based on AI freedom
-    freedom = spec.ai_freedom or 50
-    if freedom < 30:
-        strictness = "Follow the specifications exactly. Do not deviate from the requested style, structure, or content."
-    elif freedom > 70:
-        strictness = "Use these specifications as a starting point but feel free to make creative additions that enhance the song while staying true to the theme."
-    else:
-        strictness = "Follow the specifications while allowing some creative interpretation where it improves the flow."
-    
-    # Main instruction
-    if section_to_rewrite and rewrite_lyrics:
-        rhyme_instruction = ""
-        if section_rhyme_scheme:
-            rhyme_instruction = f"\nIMPORTANT: Use {section_rhyme_scheme} rhyme scheme for this {section_to_rewrite}."
+        if self.api_base:
+            args["api_base"] = self.api_base
+        if self.custom_llm_provider:
+            args["custom_llm_provider"] = self.custom_llm_provider
+        if self.client is not None:
+            args["client"] = self.client
+        return args
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        return cls(
+            api_key=os.environ.get("EMERGENT_LLM_KEY"),
+            provider=os.environ.get("LLM_PROVIDER", "openai"),
+            model=os.environ.get("LLM_MODEL", "gpt-5.2"),
+            api_base=os.environ.get("LLM_API_BASE"),
+            max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", "10")),
+            keepalive_expiry=float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "30")),
+        )
+
+    async def start(self):
+        self.http_client = httpx.AsyncClient(limits=self.limits, timeout=None)
+        # litellm only accepts an explicit client on its OpenAI-compatible
+        # path, which covers the proxy and provider="openai"; other providers
+        # fall back to litellm's own transport.
+        if self.custom_llm_provider == "openai" or self.provider == "openai":
+            self.client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.api_base,
+                http_client=self.http_client,
+                # LLMCallPolicy owns retries and deadlines
+                max_retries=0,
+            )
+
+    async def close(self):
+        self.client = None
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    async def generate(
+        self, prompt: str, temperature: float = 0.7, endpoint: Optional[str] = None, user_id: Optional[str] = None
+    ) -> str:
+        if not self.api_key:
+            raise HTTPException(status_code=500, detail="LLM API key not configured")
         
-        instruction = f"""Rewrite ONLY the {section_to_rewrite} section of this song.
+        started = time.monotonic()
+        args = self._completion_args(prompt, temperature)
+        response = await litellm.acompletion(**args)
+        text = response.choices[0].message.content or ""
+        self._report_usage(endpoint, user_id, getattr(response, "usage", None), started, args["messages"], text)
+        return text
+
+    async def stream(
+        self, prompt: str, temperature: float = 0.7, endpoint: Optional[str] = None, user_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Yield completion text deltas as the upstream model produces them."""
+        if not self.api_key:
+            raise HTTPException(status_code=500, detail="LLM API key not configured")
+        
+        started = time.monotonic()
+        args = self._completion_args(prompt, temperature)
+        response = await litellm.acompletion(**args, stream=True, stream_options={"include_usage": True})
+        usage = None
+        parts: List[str] = []
+        async for chunk in response:
+            usage = getattr(chunk, "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+        self._report_usage(endpoint, user_id, usage, started, args["messages"], "".join(parts))
+
+llm_gateway = LLMGateway.from_env()
+
+class PromptCacheMeter:
+    """Cached vs uncached input tokens per endpoint, from gateway usage.
+
+    Latency is split by whether the provider reported any cached prefix, so
+    the effect of prompt-prefix caching on response time is visible too.
+    Calls whose tokens were counted locally carry no cache data and are
+    counted as unmetered rather than as misses.
+    """
+
+    def __init__(self):
+        self._endpoints: Dict[str, Dict[str, float]] = {}
+
+    def record(self, usage: LLMUsage):
+        row = self._endpoints.setdefault(usage.endpoint or "unknown", {
+            "calls": 0, "unmetered_calls": 0,
+            "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0,
+            "cache_hit_calls": 0, "cache_hit_latency": 0.0, "cache_miss_latency": 0.0,
+        })
+        row["calls"] += 1
+        if usage.input_tokens is None or usage.estimated:
+            row["unmetered_calls"] += 1
+            return
+        row["input_tokens"] += usage.input_tokens
+        row["cached_input_tokens"] += usage.cached_input_tokens or 0
+        row["output_tokens"] += usage.output_tokens or 0
+        if usage.cached_input_tokens:
+            row["cache_hit_calls"] += 1
+            row["cache_hit_latency"] += usage.latency_seconds
+        else:
+            row["cache_miss_latency"] += usage.latency_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for name, row in self._endpoints.items():
+            metered = row["calls"] - row["unmetered_calls"]
+            misses = metered - row["cache_hit_calls"]
+            endpoints[name] = {
+                "calls": row["calls"],
+                "unmetered_calls": row["unmetered_calls"],
+                "input_tokens": row["input_tokens"],
+                "cached_input_tokens": row["cached_input_tokens"],
+                "uncached_input_tokens": row["input_tokens"] - row["cached_input_tokens"],
+                "output_tokens": row["output_tokens"],
+                "cached_input_ratio": round(row["cached_input_tokens"] / row["input_tokens"], 3) if row["input_tokens"] else None,
+                "latency_avg_cache_hit": round(row["cache_hit_latency"] / row["cache_hit_calls"], 3) if row["cache_hit_calls"] else None,
+                "latency_avg_cache_miss": round(row["cache_miss_latency"] / misses, 3) if misses else None,
+            }
+        metered = sum(row["calls"] - row["unmetered_calls"] for row in self._endpoints.values())
+        return {
+            # False until the provider reports usage for at least one call
+            "active": metered > 0,
+            "endpoints": endpoints,
+        }
 
-Current lyrics:
-{rewrite_lyrics}
+prompt_cache_meter = PromptCacheMeter()
+llm_gateway.add_usage_hook(prompt_cache_meter.record)
 
-Song specifications:
-{spec_text}
-{rhyme_instruction}
+# ============ USAGE METERING ============
 
-{strictness}
+USAGE_COUNTERS = (
+    "calls", "unmetered_calls", "estimated_calls", "input_tokens", "cached_input_tokens", "output_tokens", "latency_seconds",
+)
 
-Output ONLY the complete song lyrics with the rewritten {section_to_rewrite}. Keep all other sections exactly as they are.
-Use section headers exactly like: [VERSE 1], [CHORUS], [VERSE 2], [BRIDGE], etc.
-Leave a blank line between sections.
-Do not include any explanations or commentary."""
-    
-    elif rewrite_lyrics:
-        instruction = f"""Rewrite this entire song while maintaining its core essence and theme.
+class UsageMeter:
+    """Per-user, per-endpoint LLM usage, batched into ``llm_usage``.
+
+    Calls are folded in memory into hourly rows keyed by (period, user,
+    endpoint, model) and flushed every ``flush_seconds`` (or sooner once
+    ``max_pending`` rows accumulate) as one bulk write of ``$inc`` upserts,
+    so the write rate depends on active users rather than on call volume.
+    Rows from a failed flush are merged back and retried next time.
+    """
+
+    def __init__(self, collection, flush_seconds: float = 30.0, max_pending: int = 2000):
+        self.collection = collection
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[datetime, str, str, str], Dict[str, float]] = {}
+        self._flush_now = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_errors = 0
+
+    def record(self, usage: LLMUsage):
+        period = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        key = (period, usage.user_id or "anonymous", usage.endpoint or "unknown", usage.model)
+        row = self._pending.get(key)
+        if row is None:
+            row = self._pending[key] = dict.fromkeys(USAGE_COUNTERS, 0)
+        row["calls"] += 1
+        row["latency_seconds"] += usage.latency_seconds
+        if usage.input_tokens is None:
+            row["unmetered_calls"] += 1
+        else:
+            row["input_tokens"] += usage.input_tokens
+            row["cached_input_tokens"] += usage.cached_input_tokens or 0
+            row["output_tokens"] += usage.output_tokens or 0
+            if usage.estimated:
+                row["estimated_calls"] += 1
+        if len(self._pending) >= self.max_pending:
+            self._flush_now.set()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        ops = [
+            UpdateOne(
+                {"period": period, "user_id": user_id, "endpoint": endpoint, "model": model},
+                {"$inc": row},
+                upsert=True,
+            )
+            for (period, user_id, endpoint, model), row in pending.items()
+        ]
+        try:
+            await self.collection.bulk_write(ops, ordered=False)
+        except Exception as e:
+            self.flush_errors += 1
+            logger.error(f"Flushing {len(ops)} usage rows failed: {e}")
+            for key, row in pending.items():
+                merged = self._pending.setdefault(key, dict.fromkeys(USAGE_COUNTERS, 0))
+                for counter, value in row.items():
+                    merged[counter] += value
+            return
+        self.flushes += 1
+        self.rows_written += len(ops)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_rows": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "flush_errors": self.flush_errors,
+        }
 
-Current lyrics:
-{rewrite_lyrics}
+usage_meter = UsageMeter(
+    db.llm_usage,
+    flush_seconds=float(os.environ.get("USAGE_FLUSH_SECONDS", "30")),
+    max_pending=int(os.environ.get("USAGE_MAX_PENDING_ROWS", "2000")),
+)
+llm_gateway.add_usage_hook(usage_meter.record)
+
+def usage_rollup_stage(field: Optional[str]) -> Dict[str, Any]:
+    group: Dict[str, Any] = {"_id": f"${field}" if field else None}
+    for counter in USAGE_COUNTERS:
+        group[counter] = {"$sum": f"${counter}"}
+    return {"$group": group}
+
+@api_router.get("/admin/usage")
+async def usage_rollup(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    flush: bool = False,
+    admin: User = Depends(require_admin)
+):
+    """Token, call and latency totals per user and per endpoint.
+
+    Defaults to the last 24 hours. Users are ranked by total tokens, which
+    surfaces the heaviest (and possibly abusive) consumers first. Usage not
+    yet flushed (up to USAGE_FLUSH_SECONDS old) is not included unless
+    ``flush`` is set; that only covers this process's pending rows.
+    """
+    if flush:
+        await usage_meter.flush()
+    since = _as_utc(since) if since else datetime.now(timezone.utc) - timedelta(hours=24)
+    match: Dict[str, Any] = {"period": {"$gte": since.replace(minute=0, second=0, microsecond=0)}}
+    if until:
+        match["period"]["$lt"] = _as_utc(until)
+    if user_id:
+        match["user_id"] = user_id
+    if endpoint:
+        match["endpoint"] = endpoint
+    
+    rank = [
+        {"$addFields": {"total_tokens": {"$add": ["$input_tokens", "$output_tokens"]}}},
+        {"$sort": {"total_tokens": -1}},
+    ]
+    facets = await db.llm_usage.aggregate([
+        {"$match": match},
+        {"$facet": {
+            "totals": [usage_rollup_stage(None)],
+            "by_user": [usage_rollup_stage("user_id"), *rank, {"$limit": limit}],
+            "by_endpoint": [usage_rollup_stage("endpoint"), *rank],
+            "by_model": [usage_rollup_stage("model"), *rank],
+            "by_hour": [usage_rollup_stage("period"), {"$sort": {"_id": 1}}],
+        }},
+    ]).to_list(1)
+    result = facets[0] if facets else {}
+    
+    def rows(name: str, key: str) -> List[Dict[str, Any]]:
+        out = []
+        for row in result.get(name, []):
+            row[key] = row.pop("_id")
+            row["latency_avg_seconds"] = round(row["latency_seconds"] / row["calls"], 3) if row["calls"] else None
+            row.pop("total_tokens", None)
+            out.append(row)
+        return out
+    
+    totals = rows("totals", "scope")
+    return {
+        "since": since.isoformat(),
+        "until": _as_utc(until).isoformat() if until else None,
+        "totals": totals[0] if totals else None,
+        "by_user": rows("by_user", "user_id"),
+        "by_endpoint": rows("by_endpoint", "endpoint"),
+        "by_model": rows("by_model", "model"),
+        "by_hour": rows("by_hour", "period"),
+        "meter": usage_meter.stats(),
+    }
 
-Song specifications:
-{spec_text}
+# ============ LLM RESPONSE CACHE ============
+
+class ResponseCache:
+    """Content-addressed cache of LLM completions.
+
+    Keys hash the final prompt text, model and temperature. The first tier is
+    an in-process LRU bounded by entry count and total characters; the
+    optional second tier is a Mongo collection so results survive restarts
+    and are shared across workers. Only endpoints listed in ``endpoints`` use
+    the cache, since some operations (variations) need fresh output.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        endpoints: Optional[set] = None,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 1000,
+        max_chars: int = 8_000_000,
+        collection=None,
+    ):
+        self.enabled = enabled
+        self.endpoints = endpoints if endpoints is not None else set()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.collection = collection
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(prompt: str, model: str, temperature: float) -> str:
+        digest = hashlib.sha256()
+        for part in (model, f"{temperature:.4f}", prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def allows(self, endpoint: Optional[str]) -> bool:
+        return self.enabled and endpoint in self.endpoints
+
+    def _drop(self, key: str):
+        value, _ = self._entries.pop(key)
+        self._chars -= len(value)
+
+    def _store_local(self, key: str, value: str, deadline: float):
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, deadline)
+        self._chars += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, deadline = entry
+            if deadline > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop(key)
+        
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"key": key}, {"_id": 0, "value": 1, "expires_at": 1})
+            except Exception as e:
+                logger.warning(f"LLM cache lookup failed: {e}")
+                doc = None
+            if doc:
+                expires_at = doc["expires_at"]
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+                if expires_at.timestamp() > time.time():
+                    self._store_local(key, doc["value"], expires_at.timestamp())
+                    self.remote_hits += 1
+                    return doc["value"]
+        
+        self.misses += 1
+        return None
 
-{strictness}
+    async def set(self, key: str, value: str, model: str):
+        deadline = time.time() + self.ttl_seconds
+        self._store_local(key, value, deadline)
+        
+        if self.collection is not None:
+            try:
+                await self.collection.update_one(
+                    {"key": key},
+                    {"$set": {
+                        "key": key,
+                        "value": value,
+                        "model": model,
+                        "expires_at": datetime.fromtimestamp(deadline, timezone.utc)
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "endpoints": sorted(self.endpoints),
+            "mongo_tier": self.collection is not None,
+            "size": len(self._entries),
+            "chars": self._chars,
+            "max_entries": self.max_entries,
+            "max_chars": self.max_chars,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
 
-Output ONLY the lyrics. Use section headers exactly like: [VERSE 1], [CHORUS], [VERSE 2], [BRIDGE], etc.
-Leave a blank line between sections.
-Do not include any explanations or commentary."""
-    
-    else:
-        instruction = f"""Write original song lyrics based on these specifications:
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.environ.get(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+response_cache = ResponseCache(
+    enabled=_env_flag("LLM_CACHE_ENABLED"),
+    endpoints={
+        e.strip() for e in os.environ.get(
+            "LLM_CACHE_ENDPOINTS", "generate,rewrite,rewrite-section,custom-edit,transform"
+        ).split(",") if e.strip()
+    },
+    ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1000")),
+    max_chars=int(os.environ.get("LLM_CACHE_MAX_CHARS", "8000000")),
+    collection=db.llm_response_cache if _env_flag("LLM_CACHE_MONGO") else None,
+)
 
-{spec_text}
+# ============ LLM ADMISSION CONTROL ============
+
+_prepaid_llm_cost: contextvars.ContextVar = contextvars.ContextVar("prepaid_llm_cost", default=None)
+
+class AdmissionController:
+    """Bounds upstream LLM concurrency and shares it fairly between users.
+
+    A global slot count caps in-flight calls. Callers that cannot get a slot
+    wait in per-user FIFO queues that are served round-robin, so one user
+    with many pending calls cannot starve the others. Per-user token buckets
+    cap request rate, and a full queue is rejected immediately with a 429 and
+    Retry-After instead of letting the request time out.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        user_rate_per_sec: float = 0.5,
+        user_burst: float = 12.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.user_rate_per_sec = user_rate_per_sec
+        self.user_burst = user_burst
+        self.running = 0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._buckets: Dict[str, list] = {}
+        self._avg_service_seconds = 5.0
+        self.admitted = 0
+        self.rejected_rate_limited = 0
+        self.rejected_queue_full = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def charge(self, user_id: str, cost: float = 1.0):
+        """Take ``cost`` tokens from the user's bucket or raise 429."""
+        prepaid = _prepaid_llm_cost.get()
+        if prepaid is not None and prepaid[0] >= cost:
+            prepaid[0] -= cost
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.user_burst, now]
+        tokens = min(self.user_burst, bucket[0] + (now - bucket[1]) * self.user_rate_per_sec)
+        bucket[1] = now
+        if tokens < cost:
+            bucket[0] = tokens
+            self.rejected_rate_limited += 1
+            retry_after = math.ceil((cost - tokens) / self.user_rate_per_sec) if self.user_rate_per_sec > 0 else 60
+            raise HTTPException(
+                status_code=429,
+                detail="Too many lyrics requests, slow down",
+                headers={"Retry-After": str(max(retry_after, 1))}
+            )
+        bucket[0] = tokens - cost
+        if len(self._buckets) > 10000:
+            self._prune_buckets(now)
+
+    @contextmanager
+    def prepaid(self, cost: float):
+        """Skip charging for work whose cost was already taken (queued jobs)."""
+        token = _prepaid_llm_cost.set([cost])
+        try:
+            yield
+        finally:
+            _prepaid_llm_cost.reset(token)
+
+    def _prune_buckets(self, now: float):
+        full_after = self.user_burst / self.user_rate_per_sec if self.user_rate_per_sec > 0 else float("inf")
+        for user_id in [u for u, (_, seen) in self._buckets.items() if now - seen > full_after]:
+            del self._buckets[user_id]
+
+    def ensure_capacity(self):
+        """Raise 429 right away if a new caller would overflow the queue."""
+        if self.running >= self.max_concurrency and self._queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            retry_after = math.ceil(self._avg_service_seconds * (self._queued + 1) / self.max_concurrency)
+            raise HTTPException(
+                status_code=429,
+                detail="Lyrics service is busy, try again shortly",
+                headers={"Retry-After": str(max(retry_after, 1))}
+            )
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        started = time.monotonic()
+        if self.running < self.max_concurrency and not self._queued:
+            self.running += 1
+        else:
+            self.ensure_capacity()
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(user_id, deque()).append(waiter)
+            self._queued += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Granted a slot just as we were cancelled: hand it on.
+                    self._release()
+                else:
+                    self._discard(user_id, waiter)
+                raise
+            waited = time.monotonic() - started
+            add_stage_time("llm_queue", waited)
+            self.wait_count += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        
+        self.admitted += 1
+        service_started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - service_started
+            self._avg_service_seconds = 0.9 * self._avg_service_seconds + 0.1 * elapsed
+            self._release()
+
+    def _discard(self, user_id: str, waiter: asyncio.Future):
+        queue = self._queues.get(user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+            self._queued -= 1
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[user_id]
+
+    def _release(self):
+        self.running -= 1
+        while self._queues and self.running < self.max_concurrency:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not waiter.done():
+                self.running += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._queued,
+            "queued_users": len(self._queues),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_queue_full": self.rejected_queue_full,
+            "waits": self.wait_count,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.wait_count, 4) if self.wait_count else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 4),
+        }
 
-{strictness}
+llm_admission = AdmissionController(
+    max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "16")),
+    max_queue=int(os.environ.get("LLM_MAX_QUEUE", "64")),
+    user_rate_per_sec=float(os.environ.get("LLM_USER_RATE_PER_SEC", "0.5")),
+    user_burst=float(os.environ.get("LLM_USER_BURST", "12")),
+)
 
-Output ONLY the lyrics. Use section headers exactly like: [VERSE 1], [CHORUS], [VERSE 2], [BRIDGE], etc.
-Leave a blank line between sections.
-Do not include any explanations or commentary."""
-    
-    return instruction
+# ============ SINGLE-FLIGHT ============
+
+class SingleFlight:
+    """Collapse concurrent identical calls onto one in-flight task.
+
+    Every caller awaits the shared task through ``asyncio.shield`` so one
+    caller being cancelled does not cancel the work for the others; the
+    task itself is only cancelled once its last waiter has gone away. If the
+    leader fails, every waiter sees the same exception.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, list] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.abandoned = 0
+
+    def _forget(self, key: str, call: list):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, fn):
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(fn())
+            call = [task, 0]
+            self._calls[key] = call
+            task.add_done_callback(lambda _, k=key, c=call: self._forget(k, c))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not task.done():
+                self._forget(key, call)
+                task.cancel()
+                self.abandoned += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "abandoned": self.abandoned,
+        }
 
-async def generate_with_llm(prompt: str, temperature: float = 0.7) -> str:
-    """Generate lyrics using OpenAI GPT-5.2 via emergentintegrations."""
-    api_key = os.environ.get("EMERGENT_LLM_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="LLM API key not configured")
-    
-    chat = LlmChat(
-        api_key=api_key,
-        session_id=f"lyrics_{uuid.uuid4().hex[:8]}",
-        system_message="You are a professional songwriter and lyricist. You write compelling, creative, and emotionally resonant song lyrics. You follow formatting instructions precisely."
+llm_single_flight = SingleFlight()
+
+# ============ LLM DEADLINES, RETRIES AND HEDGING ============
+
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "InternalServerError",
+    "RateLimitError", "ServiceUnavailableError", "Timeout",
+}
+
+def is_transient_llm_error(error: BaseException) -> bool:
+    """Whether an upstream failure is worth retrying."""
+    if isinstance(error, HTTPException):
+        return False
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in TRANSIENT_STATUS_CODES
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+class LLMCallPolicy:
+    """Deadline, retry and hedging policy for upstream LLM calls.
+
+    Every call gets a deadline budget for its endpoint that covers queueing,
+    retries and the upstream request itself; exceeding it cancels the work
+    and surfaces a 504. Transient failures are retried with full-jitter
+    exponential backoff while budget remains. With hedging enabled, a call
+    still running after its endpoint's recent ``hedge_quantile`` latency gets one
+    duplicate and whichever finishes first wins; the share of calls that
+    may be hedged is capped over a sliding window.
+
+    Streams can't be retried or hedged once tokens reach the client, so
+    ``stream`` only enforces the deadline, plus ``stream_idle_timeout``
+    between chunks once the first one has arrived.
+    """
+
+    def __init__(
+        self,
+        default_deadline: float = 120.0,
+        deadlines: Optional[Dict[str, float]] = None,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_enabled: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_max_ratio: float = 0.1,
+        hedge_min_samples: int = 20,
+        endpoint_min_samples: Optional[Dict[str, float]] = None,
+        stream_idle_timeout: float = 30.0,
+        window: int = 500,
+    ):
+        self.default_deadline = default_deadline
+        self.deadlines = deadlines or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_min_samples = hedge_min_samples
+        self.endpoint_min_samples = endpoint_min_samples or {}
+        self.stream_idle_timeout = stream_idle_timeout
+        self.window = window
+        # Endpoints differ widely in latency, so each gets its own window
+        self._latencies: Dict[str, deque] = {}
+        self._hedge_window: deque = deque(maxlen=window)
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.hedges_capped = 0
+        self.streams = 0
+        self.stream_timeouts = 0
+        self.stream_idle_timeouts = 0
+
+    @staticmethod
+    def parse_endpoint_values(spec: str) -> Dict[str, float]:
+        """Parse per-endpoint settings such as ``"variations=60,transform=90"``."""
+        deadlines = {}
+        for item in spec.split(","):
+            name, _, seconds = item.partition("=")
+            if name.strip() and seconds.strip():
+                deadlines[name.strip()] = float(seconds)
+        return deadlines
+
+    def deadline_for(self, endpoint: Optional[str]) -> float:
+        return self.deadlines.get(endpoint or "", self.default_deadline)
+
+    def min_samples_for(self, endpoint: Optional[str]) -> int:
+        return int(self.endpoint_min_samples.get(endpoint or "", self.hedge_min_samples))
+
+    def hedge_delay(self, endpoint: Optional[str]) -> Optional[float]:
+        """The endpoint's recent latency at ``hedge_quantile``, or None without enough samples."""
+        samples = self._latencies.get(endpoint or "")
+        if samples is None or len(samples) < self.min_samples_for(endpoint):
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+    def _hedge_allowed(self) -> bool:
+        window = self._hedge_window
+        return sum(window) < self.hedge_max_ratio * max(len(window), 1)
+
+    async def _timed(self, fn, endpoint: Optional[str]) -> str:
+        started = time.monotonic()
+        result = await fn()
+        samples = self._latencies.get(endpoint or "")
+        if samples is None:
+            samples = self._latencies[endpoint or ""] = deque(maxlen=self.window)
+        samples.append(time.monotonic() - started)
+        return result
+
+    async def _attempt(self, fn, endpoint: Optional[str]) -> str:
+        delay = self.hedge_delay(endpoint) if self.hedge_enabled else None
+        primary = asyncio.ensure_future(self._timed(fn, endpoint))
+        hedge = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    if self._hedge_allowed():
+                        hedge = asyncio.ensure_future(self._timed(fn, endpoint))
+                        self.hedged += 1
+                    else:
+                        self.hedges_capped += 1
+                self._hedge_window.append(1 if hedge is not None else 0)
+            if hedge is None:
+                return await primary
+            
+            # Take the first success; fail only if both attempts do
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        else:
+                            self.primary_wins += 1
+                        return task.result()
+            return await primary
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def call(self, fn, endpoint: Optional[str] = None) -> str:
+        """Run ``fn`` (a coroutine factory) under the endpoint's policy."""
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_for(endpoint)
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                return await asyncio.wait_for(self._attempt(fn, endpoint), remaining)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"LLM call for {endpoint or 'unknown endpoint'} exceeded its deadline")
+                raise HTTPException(status_code=504, detail="The lyrics model took too long to respond")
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_llm_error(e):
+                    raise
+                attempt += 1
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if loop.time() + backoff >= deadline:
+                    raise
+                self.retries += 1
+                logger.warning(f"Retrying LLM call after transient error ({attempt}/{self.max_retries}): {e}")
+                await asyncio.sleep(backoff)
+
+    async def stream(self, chunks: AsyncIterator[str], endpoint: Optional[str] = None, started: Optional[float] = None) -> AsyncIterator[str]:
+        """Relay ``chunks`` within the endpoint deadline and the idle timeout.
+
+        ``started`` (``loop.time()``) lets time spent queueing for a slot
+        count against the budget. On overrun the upstream stream is closed
+        and a 504 raised, so the caller's admission slot is released.
+        """
+        self.streams += 1
+        loop = asyncio.get_running_loop()
+        deadline = (started if started is not None else loop.time()) + self.deadline_for(endpoint)
+        iterator = chunks.__aiter__()
+        # Time to first token is bounded by the deadline alone: the gateway's
+        # non-streaming fallback delivers everything as one late chunk.
+        idle = float("inf")
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), max(0.0, min(remaining, idle)))
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    if remaining <= idle:
+                        self.stream_timeouts += 1
+                        detail = "The lyrics model took too long to respond"
+                    else:
+                        self.stream_idle_timeouts += 1
+                        detail = "The lyrics model stopped responding"
+                    logger.warning(f"LLM stream for {endpoint or 'unknown endpoint'}: {detail.lower()}")
+                    raise HTTPException(status_code=504, detail=detail)
+                idle = self.stream_idle_timeout
+                yield chunk
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        delays = {}
+        for endpoint, samples in self._latencies.items():
+            delay = self.hedge_delay(endpoint)
+            delays[endpoint or "unknown"] = {
+                "samples": len(samples),
+                "min_samples": self.min_samples_for(endpoint),
+                "hedge_delay_seconds": round(delay, 3) if delay is not None else None,
+            }
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedging_enabled": self.hedge_enabled,
+            "hedge_delays": delays,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "hedges_capped": self.hedges_capped,
+            "hedge_win_rate": round(self.hedge_wins / self.hedged, 3) if self.hedged else None,
+            "streams": self.streams,
+            "stream_timeouts": self.stream_timeouts,
+            "stream_idle_timeouts": self.stream_idle_timeouts,
+            "stream_idle_timeout_seconds": self.stream_idle_timeout,
+            "default_deadline_seconds": self.default_deadline,
+            "deadlines": self.deadlines,
+        }
+
+llm_call_policy = LLMCallPolicy(
+    default_deadline=float(os.environ.get("LLM_DEADLINE_SECONDS", "120")),
+    deadlines=LLMCallPolicy.parse_endpoint_values(
+        os.environ.get("LLM_ENDPOINT_DEADLINES", "variations=60,transform-repair=45")
+    ),
+    max_retries=int(os.environ.get("LLM_MAX_RETRIES", "2")),
+    backoff_base=float(os.environ.get("LLM_RETRY_BACKOFF_SECONDS", "0.5")),
+    backoff_max=float(os.environ.get("LLM_RETRY_BACKOFF_MAX_SECONDS", "8")),
+    hedge_enabled=_env_flag("LLM_HEDGE_ENABLED"),
+    hedge_quantile=float(os.environ.get("LLM_HEDGE_QUANTILE", "0.95")),
+    hedge_max_ratio=float(os.environ.get("LLM_HEDGE_MAX_RATIO", "0.1")),
+    hedge_min_samples=int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20")),
+    endpoint_min_samples=LLMCallPolicy.parse_endpoint_values(os.environ.get("LLM_HEDGE_ENDPOINT_MIN_SAMPLES", "")),
+    stream_idle_timeout=float(os.environ.get("LLM_STREAM_IDLE_SECONDS", "30")),
+)
+
+async def generate_with_llm(
+    prompt: str,
+    temperature: float = 0.7,
+    endpoint: Optional[str] = None,
+    user_id: Optional[str] = None,
+    dedup_key: Optional[str] = None,
+) -> str:
+    """Generate lyrics using OpenAI GPT-5.2 via the shared LLM gateway.
+
+    ``endpoint`` names the calling operation; the response cache is only
+    consulted when its policy allows that endpoint. When ``user_id`` is
+    given, concurrent identical requests from that user share one upstream
+    call. Callers that deliberately send the same prompt several times in
+    parallel (variations) pass a distinct ``dedup_key`` per call so each one
+    reaches the provider.
+    """
+    if user_id is None:
+        return await _generate_uncoalesced(prompt, temperature, endpoint, user_id)
+    
+    key = f"{user_id}:{dedup_key or ''}:{ResponseCache.key_for(prompt, llm_gateway.model, temperature)}"
+    return await llm_single_flight.do(
+        key, lambda: _generate_uncoalesced(prompt, temperature, endpoint, user_id)
+    )
+
+async def _generate_admitted(prompt: str, temperature: float, user_id: Optional[str], endpoint: Optional[str] = None) -> str:
+    async with llm_admission.slot(user_id or "anonymous"):
+        with stage("llm"):
+            return await llm_gateway.generate(prompt, temperature, endpoint, user_id)
+
+async def _generate_with_policy(prompt: str, temperature: float, endpoint: Optional[str], user_id: Optional[str]) -> str:
+    return await llm_call_policy.call(lambda: _generate_admitted(prompt, temperature, user_id, endpoint), endpoint)
+
+async def _generate_uncoalesced(prompt: str, temperature: float, endpoint: Optional[str], user_id: Optional[str]) -> str:
+    if not response_cache.allows(endpoint):
+        return await _generate_with_policy(prompt, temperature, endpoint, user_id)
+    
+    key = ResponseCache.key_for(prompt, llm_gateway.model, temperature)
+    cached = await response_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    lyrics = await _generate_with_policy(prompt, temperature, endpoint, user_id)
+    await response_cache.set(key, lyrics, llm_gateway.model)
+    return lyrics
+
+async def stream_lyrics_events(prompt: str, temperature: float = 0.7, user_id: str = "anonymous", endpoint: Optional[str] = None) -> AsyncIterator[str]:
+    """Stream an LLM completion as NDJSON events.
+
+    Emits a ``token`` event for every upstream delta, a ``section`` event as
+    soon as each ``[SECTION]`` block is complete, and a final ``done`` event
+    carrying the full lyrics (or an ``error`` event if the upstream fails).
+    """
+    def event(payload: Dict[str, Any]) -> str:
+        return json.dumps(payload) + "\n"
+    
+    chunks: List[str] = []
+    pending = ""
+    header: Optional[str] = None
+    section_lines: List[str] = []
+    section_index = 0
+    
+    def finish_section() -> Optional[str]:
+        nonlocal section_index
+        if header is None:
+            return None
+        text = "\n".join([f"[{header}]"] + section_lines).strip()
+        payload = {"type": "section", "index": section_index, "header": header, "lyrics": text}
+        section_index += 1
+        return event(payload)
+    
+    def consume_line(line: str) -> Optional[str]:
+        nonlocal header, section_lines
+        match = SECTION_HEADER_RE.match(line)
+        if not match:
+            if header is not None:
+                section_lines.append(line)
+            return None
+        completed = finish_section()
+        header, section_lines = match.group(1).strip(), []
+        return completed
+    
+    started = asyncio.get_running_loop().time()
+    try:
+        async with llm_admission.slot(user_id):
+            with stage("llm"):
+                upstream = llm_gateway.stream(prompt, temperature, endpoint, user_id)
+                async for delta in llm_call_policy.stream(upstream, endpoint, started):
+                    chunks.append(delta)
+                    yield event({"type": "token", "text": delta})
+                    pending += delta
+                    while "\n" in pending:
+                        line, pending = pending.split("\n", 1)
+                        completed = consume_line(line)
+                        if completed:
+                            yield completed
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Lyrics stream failed: {detail}")
+        yield event({"type": "error", "detail": detail})
+        return
+    
+    if pending:
+        completed = consume_line(pending)
+        if completed:
+            yield completed
+    completed = finish_section()
+    if completed:
+        yield completed
+    yield event({"type": "done", "lyrics": "".join(chunks)})
+
+def ndjson_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    chat.with_model("openai", "gpt-5.2")
-    
-    user_message = UserMessage(text=prompt)
-    response = await chat.send_message(user_message)
-    
-    return response
 
-@api_router.post("/lyrics/generate")
+@api_router.post("/lyrics/generate", response_class=FastJSONResponse)
 async def generate_lyrics(request: GenerateLyricsRequest, user: User = Depends(get_current_user)):
     """Generate new lyrics from scratch based on SongSpec."""
+    llm_admission.charge(user.user_id)
     prompt = build_lyrics_prompt(request.song_spec)
     
     # Map AI freedom to temperature (0-100 -> 0.3-1.0)
     freedom = request.song_spec.ai_freedom or 50
     temperature = 0.3 + (freedom / 100) * 0.7
     
-    lyrics = await generate_with_llm(prompt, temperature)
+    lyrics = await generate_with_llm(prompt, temperature, endpoint="generate", user_id=user.user_id)
     return {"lyrics": lyrics}
 
-@api_router.post("/lyrics/rewrite")
+@api_router.post("/lyrics/rewrite", response_class=FastJSONResponse)
 async def rewrite_lyrics(request: RewriteLyricsRequest, user: User = Depends(get_current_user)):
     """Rewrite entire song using current lyrics as reference."""
+    llm_admission.charge(user.user_id)
     prompt = build_lyrics_prompt(request.song_spec, rewrite_lyrics=request.current_lyrics)
     
     freedom = request.song_spec.ai_freedom or 50
     temperature = 0.3 + (freedom / 100) * 0.7
     
-    lyrics = await generate_with_llm(prompt, temperature)
-    return {"lyrics": lyrics}
+    lyrics = await generate_with_llm(prompt, temperature, endpoint="rewrite", user_id=user.user_id)
+    return {"lyrics": lyrics, "analysis": prosody.compare_lyrics(request.current_lyrics, lyrics)}
+
+@api_router.post("/lyrics/generate/stream")
+async def generate_lyrics_stream(request: GenerateLyricsRequest, user: User = Depends(get_current_user)):
+    """Stream newly generated lyrics as NDJSON token and section events."""
+    llm_admission.charge(user.user_id)
+    prompt = build_lyrics_prompt(request.song_spec)
+    
+    freedom = request.song_spec.ai_freedom or 50
+    temperature = 0.3 + (freedom / 100) * 0.7
+    
+    llm_admission.ensure_capacity()
+    return ndjson_response(stream_lyrics_events(prompt, temperature, user.user_id, endpoint="generate-stream"))
+
+@api_router.post("/lyrics/rewrite/stream")
+async def rewrite_lyrics_stream(request: RewriteLyricsRequest, user: User = Depends(get_current_user)):
+    """Stream a full-song rewrite as NDJSON token and section events."""
+    llm_admission.charge(user.user_id)
+    prompt = build_lyrics_prompt(request.song_spec, rewrite_lyrics=request.current_lyrics)
+    
+    freedom = request.song_spec.ai_freedom or 50
+    temperature = 0.3 + (freedom / 100) * 0.7
+    
+    llm_admission.ensure_capacity()
+    return ndjson_response(stream_lyrics_events(prompt, temperature, user.user_id, endpoint="rewrite-stream"))
 
-@api_router.post("/lyrics/rewrite-section")
+@api_router.post("/lyrics/rewrite-section", response_class=FastJSONResponse)
 async def rewrite_section(request: RewriteSectionRequest, user: User = Depends(get_current_user)):
     """Rewrite a specific section of the song with optional rhyme scheme override."""
+    llm_admission.charge(user.user_id)
+    freedom = request.song_spec.ai_freedom or 50
+    temperature = 0.3 + (freedom / 100) * 0.7
+    
+    scoped = find_section_targets(request.current_lyrics, request.section)
+    if scoped:
+        # Send only the target section and splice the result back locally
+        section_text, targets, parsed = scoped
+        prompt = build_lyrics_prompt(
+            request.song_spec,
+            rewrite_lyrics=section_text,
+            section_to_rewrite=request.section,
+            section_rhyme_scheme=request.section_rhyme_scheme,
+            song_outline=parsed.outline()
+        )
+        output = await generate_with_llm(prompt, temperature, endpoint="rewrite-section", user_id=user.user_id)
+        body = extract_section_body(output)
+        if not body:
+            raise HTTPException(status_code=502, detail="Model returned an empty section")
+        return {"lyrics": splice_section(request.current_lyrics, targets, body)}
+    
     prompt = build_lyrics_prompt(
         request.song_spec,
         rewrite_lyrics=request.current_lyrics,
@@ -451,62 +1682,74 @@ async def rewrite_section(request: RewriteSectionRequest, user: User = Depends(g
         section_rhyme_scheme=request.section_rhyme_scheme
     )
     
-    freedom = request.song_spec.ai_freedom or 50
-    temperature = 0.3 + (freedom / 100) * 0.7
-    
-    lyrics = await generate_with_llm(prompt, temperature)
+    lyrics = await generate_with_llm(prompt, temperature, endpoint="rewrite-section", user_id=user.user_id)
     return {"lyrics": lyrics}
 
-@api_router.post("/lyrics/variations")
-async def generate_variations(request: GenerateVariationsRequest, user: User = Depends(get_current_user)):
-    """Generate multiple variations of lyrics or a specific section."""
-    import asyncio
-    
+def build_variation_prompt(request: GenerateVariationsRequest, index: int) -> Tuple[str, float]:
+    """Prompt and temperature for the ``index``-th variation."""
     freedom = request.song_spec.ai_freedom or 50
     # Higher temperature for more variety in variations
     base_temp = 0.5 + (freedom / 100) * 0.5
+    # Vary temperature slightly for each variation
+    temp = base_temp + (index * 0.05)
+    temp = min(temp, 1.0)
     
-    async def generate_single_variation(index: int):
-        # Vary temperature slightly for each variation
-        temp = base_temp + (index * 0.05)
-        temp = min(temp, 1.0)
-        
-        rhyme_instruction = ""
-        if request.section_rhyme_scheme:
-            rhyme_instruction = f"\nIMPORTANT: Use {request.section_rhyme_scheme} rhyme scheme for this section."
-        
-        if request.section:
-            # Generate variation of specific section
-            prompt = f"""Generate an alternative version of the {request.section} for this song.
-
-Current lyrics:
-{request.current_lyrics}
-
-Song specifications:
-Title: {request.song_spec.title or 'Untitled'}
-Topic: {request.song_spec.topic or 'General'}
-Genre: {request.song_spec.genre or 'Any'} {('(' + request.song_spec.subgenre + ')') if request.song_spec.subgenre else ''}
-Mood: {request.song_spec.custom_mood or request.song_spec.mood or 'Any'}
-{rhyme_instruction}
-
-Create a fresh, creative alternative for the {request.section}. 
-Make it distinctly different from the original while keeping the same theme.
-Output ONLY the {request.section} lyrics, nothing else. Include the section header like [{request.section.upper()}]."""
-        else:
-            # Generate full song variation
-            prompt = build_lyrics_prompt(request.song_spec)
-            prompt += "\n\nCreate a fresh, creative version that explores the theme differently."
-        
-        try:
-            result = await generate_with_llm(prompt, temp)
-            return {"index": index, "lyrics": result}
-        except Exception as e:
-            logger.error(f"Variation {index} failed: {e}")
-            return {"index": index, "lyrics": None, "error": str(e)}
-    
+    prompt = prompts.build_variation_prompt(
+        request.song_spec, request.current_lyrics, request.section, request.section_rhyme_scheme
+    )
+    return prompt, temp
+
+async def generate_single_variation(request: GenerateVariationsRequest, index: int, user_id: str) -> Dict[str, Any]:
+    prompt, temp = build_variation_prompt(request, index)
+    try:
+        # Temperatures cap at 1.0, so at high ai_freedom several variations share
+        # a prompt and temperature; the index keeps them from being coalesced.
+        result = await generate_with_llm(
+            prompt, temp, endpoint="variations", user_id=user_id, dedup_key=f"variation-{index}"
+        )
+        return {"index": index, "lyrics": result}
+    except Exception as e:
+        logger.error(f"Variation {index} failed: {e}")
+        return {"index": index, "lyrics": None, "error": str(e)}
+
+async def stream_variation_events(request: GenerateVariationsRequest, count: int, user_id: str) -> AsyncIterator[str]:
+    """NDJSON ``variation`` events in completion order, then ``done``.
+
+    When the client disconnects (e.g. after picking a variation) the
+    generator is closed and the variations still in flight are cancelled,
+    which aborts their upstream requests.
+    """
+    def event(payload: Dict[str, Any]) -> str:
+        return json.dumps(payload) + "\n"
+    
+    pending = {asyncio.create_task(generate_single_variation(request, i, user_id)) for i in range(count)}
+    generated = 0
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if result.get("lyrics"):
+                    generated += 1
+                    yield event({"type": "variation", **result})
+                else:
+                    yield event({"type": "error", "index": result["index"], "detail": result.get("error", "Empty result")})
+        yield event({"type": "done", "total_requested": count, "total_generated": generated})
+    finally:
+        if pending:
+            logger.info(f"Cancelling {len(pending)} in-flight variations after client disconnect")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+@api_router.post("/lyrics/variations", response_class=FastJSONResponse)
+async def generate_variations(request: GenerateVariationsRequest, user: User = Depends(get_current_user)):
+    """Generate multiple variations of lyrics or a specific section."""
     # Generate variations in parallel (limit to requested count, max 6)
     count = min(request.count, 6)
-    tasks = [generate_single_variation(i) for i in range(count)]
+    llm_admission.charge(user.user_id, cost=count)
+    llm_admission.ensure_capacity()
+    tasks = [generate_single_variation(request, i, user.user_id) for i in range(count)]
     results = await asyncio.gather(*tasks)
     
     # Filter out failed generations
@@ -514,100 +1757,416 @@ Output ONLY the {request.section} lyrics, nothing else. Include the section head
     
     return {"variations": variations, "total_requested": count, "total_generated": len(variations)}
 
-@api_router.post("/lyrics/custom-edit")
+@api_router.post("/lyrics/variations/stream")
+async def generate_variations_stream(request: GenerateVariationsRequest, user: User = Depends(get_current_user)):
+    """Stream variations as NDJSON, each as soon as it completes.
+
+    Closing the stream cancels the variations that have not finished yet.
+    """
+    count = min(request.count, 6)
+    llm_admission.charge(user.user_id, cost=count)
+    llm_admission.ensure_capacity()
+    return ndjson_response(stream_variation_events(request, count, user.user_id))
+
+@api_router.post("/lyrics/custom-edit", response_class=FastJSONResponse)
 async def custom_edit(request: CustomEditRequest, user: User = Depends(get_current_user)):
     """Apply a custom edit based on user's natural language prompt."""
+    llm_admission.charge(user.user_id)
     
     freedom = request.song_spec.ai_freedom or 50
     temperature = 0.4 + (freedom / 100) * 0.5
     
-    if request.section:
-        # Edit specific section
-        prompt = f"""Edit the {request.section} of this song based on the following instruction:
-
-USER INSTRUCTION: {request.prompt}
-
-Current full lyrics:
-{request.current_lyrics}
-
-Song context:
-Title: {request.song_spec.title or 'Untitled'}
-Genre: {request.song_spec.genre or 'Any'} {('(' + request.song_spec.subgenre + ')') if request.song_spec.subgenre else ''}
-Mood: {request.song_spec.custom_mood or request.song_spec.mood or 'Any'}
-
-IMPORTANT: Apply the user's instruction ONLY to the {request.section}. Keep all other sections exactly as they are.
-Output the COMPLETE song with all sections, with only the {request.section} modified.
-Use section headers like [VERSE 1], [CHORUS], [BRIDGE], etc.
-Do not include any explanations."""
-    else:
-        # Edit full song
-        prompt = f"""Edit this entire song based on the following instruction:
-
-USER INSTRUCTION: {request.prompt}
-
-Current lyrics:
-{request.current_lyrics}
-
-Song context:
-Title: {request.song_spec.title or 'Untitled'}
-Genre: {request.song_spec.genre or 'Any'} {('(' + request.song_spec.subgenre + ')') if request.song_spec.subgenre else ''}
-Mood: {request.song_spec.custom_mood or request.song_spec.mood or 'Any'}
-
-Apply the user's instruction to improve the song.
-Use section headers like [VERSE 1], [CHORUS], [BRIDGE], etc.
-Output ONLY the edited lyrics, no explanations."""
+    scoped = find_section_targets(request.current_lyrics, request.section) if request.section else None
+    if scoped:
+        # Send only the target section and splice the result back locally
+        section_text, targets, parsed = scoped
+        prompt = prompts.build_custom_edit_prompt(
+            request.song_spec, request.prompt, section_text, request.section, parsed.outline()
+        )
+        output = await generate_with_llm(prompt, temperature, endpoint="custom-edit", user_id=user.user_id)
+        body = extract_section_body(output)
+        if not body:
+            raise HTTPException(status_code=502, detail="Model returned an empty section")
+        return {"lyrics": splice_section(request.current_lyrics, targets, body)}
+    
+    # Without a located section, edit in the context of the full song
+    prompt = prompts.build_custom_edit_prompt(
+        request.song_spec, request.prompt, request.current_lyrics, request.section
+    )
     
-    lyrics = await generate_with_llm(prompt, temperature)
+    lyrics = await generate_with_llm(prompt, temperature, endpoint="custom-edit", user_id=user.user_id)
     return {"lyrics": lyrics}
 
-@api_router.post("/lyrics/transform")
+@api_router.post("/lyrics/transform", response_class=FastJSONResponse)
 async def transform_lyrics(request: TransformLyricsRequest, user: User = Depends(get_current_user)):
     """Transform existing lyrics - change topic/mood/genre while preserving style elements."""
-    
-    preserve_instructions = []
-    if request.keep_cadence:
-        preserve_instructions.append("PRESERVE the exact rhythm, cadence, and syllable patterns of each line")
-    if request.keep_rhyme_scheme:
-        preserve_instructions.append("PRESERVE the exact rhyme scheme and rhyme positions")
-    if request.keep_structure:
-        preserve_instructions.append("PRESERVE the exact song structure (same sections, same number of lines per section)")
-    
-    preserve_text = "\n- ".join(preserve_instructions) if preserve_instructions else "You may adjust structure as needed"
-    
-    change_instructions = []
-    if request.new_topic:
-        change_instructions.append(f"Change the TOPIC/SUBJECT to: {request.new_topic}")
-    if request.new_mood:
-        change_instructions.append(f"Change the MOOD/EMOTION to: {request.new_mood}")
-    if request.new_genre:
-        change_instructions.append(f"Adapt the STYLE to fit: {request.new_genre} genre")
-    
-    change_text = "\n- ".join(change_instructions) if change_instructions else "Improve and refine the lyrics"
-    
-    additional = f"\nAdditional instructions: {request.additional_instructions}" if request.additional_instructions else ""
-    
-    prompt = f"""Transform these existing lyrics while preserving their musical qualities.
+    llm_admission.charge(user.user_id)
+    
+    prompt = prompts.build_transform_prompt(request)
+    
+    lyrics = await generate_with_llm(prompt, 0.7, endpoint="transform", user_id=user.user_id)
+    analysis = prosody.compare_lyrics(request.current_lyrics, lyrics)
+    
+    if request.repair and (request.keep_cadence or request.keep_rhyme_scheme):
+        repaired = await repair_lines(request, lyrics, analysis, user.user_id)
+        if repaired is not None:
+            lyrics, analysis = repaired
+    
+    return {"lyrics": lyrics, "analysis": analysis}
+
+REPAIR_LINE_RE = re.compile(r"^\s*(\d+)\s*[:.)]\s*(.+?)\s*$")
+
+async def repair_lines(request: TransformLyricsRequest, lyrics: str, analysis: Dict[str, Any], user_id: str):
+    """Fix only the lines that break kept cadence or rhyme, in one small LLM call.
+
+    Returns ``(lyrics, analysis)`` with the repaired lines spliced in, or None
+    if there is nothing worth repairing (no failures, structure changed, or
+    more failing lines than ``max_repair_lines``).
+    """
+    failing = [
+        issue for issue in analysis["issues"]
+        if (request.keep_cadence and not issue["cadence_ok"])
+        or (request.keep_rhyme_scheme and not issue["rhyme_ok"])
+    ]
+    if not failing or not analysis["structure_ok"] or len(failing) > request.max_repair_lines:
+        return None
+    try:
+        llm_admission.charge(user_id)
+    except HTTPException:
+        # Out of budget: return the unrepaired result rather than failing it
+        return None
+    
+    original = parse_cache.get(request.current_lyrics)
+    parsed = parse_cache.get(lyrics)
+    
+    def line_text(doc, section_index: int, line_index: int) -> str:
+        line = doc.sections[section_index].lines[line_index]
+        return doc.text[line.start:line.end]
+    
+    def end_word(doc, section_index: int, line_index: int) -> Optional[str]:
+        tokens = doc.sections[section_index].lines[line_index].tokens
+        return doc.text[tokens[-1].start:tokens[-1].end] if tokens else None
+    
+    failing_keys = {(i["section_index"], i["line_index"]) for i in failing}
+    items = []
+    for issue in failing:
+        s_idx, l_idx = issue["section_index"], issue["line_index"]
+        constraints = []
+        if request.keep_cadence:
+            constraints.append(f"exactly {issue['original_syllables']} syllables")
+        if request.keep_rhyme_scheme:
+            scheme = analysis["original_schemes"][s_idx]
+            partners = [j for j, letter in enumerate(scheme) if j != l_idx and letter == scheme[l_idx]]
+            kept = [j for j in partners if (s_idx, j) not in failing_keys]
+            # Rhyme with a partner that still rhymes; if the whole group broke,
+            # fall back to the original partner's end word.
+            if kept:
+                partner_word = end_word(parsed, s_idx, kept[0])
+            else:
+                partner_word = end_word(original, s_idx, partners[0]) if partners else None
+            if partner_word:
+                constraints.append(f'must end with a word that rhymes with "{partner_word}"')
+        items.append(prompts.RepairItem(
+            header=issue["header"],
+            line_index=l_idx,
+            original=line_text(original, s_idx, l_idx),
+            current=line_text(parsed, s_idx, l_idx),
+            requirements=constraints,
+        ))
+    
+    prompt = prompts.build_repair_prompt(items)
+    
+    try:
+        output = await generate_with_llm(prompt, 0.5, endpoint="transform-repair", user_id=user_id)
+    except Exception as e:
+        # Keep the paid transform result even if the repair call fails
+        logger.error(f"Line repair failed: {e}")
+        return None
+    
+    replacements = {}
+    for out_line in output.splitlines():
+        match = REPAIR_LINE_RE.match(out_line)
+        if match and 1 <= int(match.group(1)) <= len(failing):
+            issue = failing[int(match.group(1)) - 1]
+            line = parsed.sections[issue["section_index"]].lines[issue["line_index"]]
+            replacements[line.start] = (line.end, match.group(2).strip().strip('"'))
+    if not replacements:
+        return None
+    
+    pieces = []
+    cursor = 0
+    for start in sorted(replacements):
+        end, text = replacements[start]
+        pieces.append(lyrics[cursor:start])
+        pieces.append(text)
+        cursor = end
+    pieces.append(lyrics[cursor:])
+    repaired = "".join(pieces)
+    
+    repaired_analysis = prosody.compare_lyrics(request.current_lyrics, repaired)
+    if len(repaired_analysis["issues"]) > len(analysis["issues"]):
+        return None
+    repaired_analysis["repaired_lines"] = len(replacements)
+    return repaired, repaired_analysis
+
+@api_router.post("/lyrics/analyze", response_class=FastJSONResponse)
+async def analyze_lyrics(request: AnalyzeLyricsRequest, user: User = Depends(get_current_user)):
+    """Syllable counts, end-rhyme keys and rhyme scheme per section, computed locally."""
+    analysis = prosody.analyze_lyrics(request.current_lyrics)
+    if request.original_lyrics is not None:
+        analysis["comparison"] = prosody.compare_lyrics(request.original_lyrics, request.current_lyrics)
+    return analysis
+
+# ============ LYRICS JOBS ============
+
+JOB_KINDS = {
+    "generate": (GenerateLyricsRequest, generate_lyrics),
+    "rewrite": (RewriteLyricsRequest, rewrite_lyrics),
+    "rewrite-section": (RewriteSectionRequest, rewrite_section),
+    "variations": (GenerateVariationsRequest, generate_variations),
+    "custom-edit": (CustomEditRequest, custom_edit),
+    "transform": (TransformLyricsRequest, transform_lyrics),
+}
+JOB_FINAL_STATUSES = ("succeeded", "failed")
+JOB_RESULT_TTL = timedelta(days=int(os.environ.get("LYRICS_JOB_RESULT_TTL_DAYS", "7")))
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: job.get(key)
+        for key in ("job_id", "kind", "status", "result", "error", "attempts", "created_at", "started_at", "finished_at")
+    }
+
+class JobWorkerPool:
+    """Runs queued lyrics jobs from the ``lyrics_jobs`` collection.
+
+    Mongo is the queue: workers claim a job with an atomic find-and-update
+    that sets a lease, and renew the lease while the job runs. A job whose
+    worker died (restart, crash) is reclaimed once its lease expires, up to
+    ``max_attempts``. Workers run in the API process by default; set
+    ``LYRICS_JOB_WORKERS=0`` there and run ``job_worker.py`` to scale them
+    separately.
+    """
+
+    def __init__(
+        self,
+        collection,
+        workers: int = 4,
+        lease_seconds: float = 120.0,
+        poll_seconds: float = 2.0,
+        max_attempts: int = 3,
+    ):
+        self.collection = collection
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self.completed = 0
+        self.failed = 0
+        self.requeued = 0
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle local workers after an enqueue instead of waiting a poll."""
+        self._wakeup.set()
+
+    async def enqueue(self, user_id: str, kind: str, request: Dict[str, Any], cost: float) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        job = {
+            "job_id": f"job_{uuid.uuid4().hex[:12]}",
+            "user_id": user_id,
+            "kind": kind,
+            "request": request,
+            "cost": cost,
+            "status": "queued",
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "available_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.collection.insert_one(dict(job))
+        self.notify()
+        return job
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": self.worker_id,
+                    "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            projection={"_id": 0},
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
 
-ORIGINAL LYRICS:
-{request.current_lyrics}
+    async def _work(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Claiming lyrics job failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.collection.update_one(
+                    {"job_id": job_id, "worker_id": self.worker_id, "status": "running"},
+                    {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}}
+                )
+            except Exception as e:
+                logger.warning(f"Renewing lease on lyrics job {job_id} failed: {e}")
+
+    async def _settle(self, job: Dict[str, Any], update: Dict[str, Any]):
+        # Only the current lease holder may settle the job
+        await self.collection.update_one(
+            {"job_id": job["job_id"], "worker_id": self.worker_id, "status": "running"},
+            {"$set": update, "$unset": {"lease_expires_at": ""}}
+        )
 
-WHAT TO PRESERVE:
-- {preserve_text}
+    async def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None):
+        now = datetime.now(timezone.utc)
+        await self._settle(job, {
+            "status": status,
+            "result": result,
+            "error": error,
+            "finished_at": now,
+            "expires_at": now + JOB_RESULT_TTL,
+        })
+        if status == "succeeded":
+            self.completed += 1
+        else:
+            self.failed += 1
 
-WHAT TO CHANGE:
-- {change_text}
-{additional}
+    async def _requeue(self, job: Dict[str, Any], delay: float):
+        self.requeued += 1
+        await self._settle(job, {
+            "status": "queued",
+            "available_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+        })
 
-IMPORTANT GUIDELINES:
-- Each new line should have the same number of syllables as the original line it replaces
-- Rhyming words should rhyme in the same positions as the original
-- The "singability" and flow must match the original
-- Use section headers like [VERSE 1], [CHORUS], [BRIDGE], etc.
+    async def _run(self, job: Dict[str, Any]):
+        if job["attempts"] > self.max_attempts:
+            await self._finish(job, "failed", error=f"Gave up after {self.max_attempts} attempts")
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(job["job_id"]))
+        try:
+            model, handler = JOB_KINDS[job["kind"]]
+            user_doc = await db.users.find_one({"user_id": job["user_id"]}, {"_id": 0})
+            if not user_doc:
+                raise HTTPException(status_code=404, detail="User not found")
+            with llm_admission.prepaid(job["cost"]):
+                result = await handler(model(**job["request"]), User(**user_doc))
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back rather than waiting out the lease
+            await asyncio.shield(self._requeue(job, 0))
+            raise
+        except Exception as e:
+            retryable = (
+                isinstance(e, HTTPException) and e.status_code == 429
+                or is_transient_llm_error(e)
+            )
+            if retryable and job["attempts"] < self.max_attempts:
+                retry_after = (getattr(e, "headers", None) or {}).get("Retry-After")
+                await self._requeue(job, float(retry_after) if retry_after else 5.0 * job["attempts"])
+            else:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Lyrics job {job['job_id']} failed: {detail}")
+                await self._finish(job, "failed", error=str(detail))
+        else:
+            await self._finish(job, "succeeded", result=result)
+        finally:
+            heartbeat.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "workers": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "requeued": self.requeued,
+        }
 
-Output ONLY the transformed lyrics, no explanations."""
-    
-    lyrics = await generate_with_llm(prompt, 0.7)
-    return {"lyrics": lyrics}
+job_workers = JobWorkerPool(
+    db.lyrics_jobs,
+    workers=int(os.environ.get("LYRICS_JOB_WORKERS", "4")),
+    lease_seconds=float(os.environ.get("LYRICS_JOB_LEASE_SECONDS", "120")),
+    max_attempts=int(os.environ.get("LYRICS_JOB_MAX_ATTEMPTS", "3")),
+)
+
+@api_router.post("/lyrics/jobs", status_code=202)
+async def create_lyrics_job(job_request: LyricsJobCreate, response: Response, user: User = Depends(get_current_user)):
+    """Queue a lyrics operation and return its job id immediately.
+
+    The result is persisted and fetched from ``GET /api/lyrics/jobs/{id}``,
+    so it survives proxy timeouts, client disconnects and worker restarts.
+    """
+    if job_request.kind not in JOB_KINDS:
+        raise HTTPException(status_code=422, detail=f"Unknown job kind: {job_request.kind}")
+    model, _ = JOB_KINDS[job_request.kind]
+    try:
+        payload = model(**job_request.request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    cost = min(payload.count, 6) if isinstance(payload, GenerateVariationsRequest) else 1
+    llm_admission.charge(user.user_id, cost=cost)
+    job = await job_workers.enqueue(user.user_id, job_request.kind, payload.model_dump(), cost)
+    response.headers["Location"] = f"/api/lyrics/jobs/{job['job_id']}"
+    return job_view(job)
+
+@api_router.get("/lyrics/jobs/{job_id}", response_class=FastJSONResponse)
+async def get_lyrics_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=50),
+    user: User = Depends(get_current_user)
+):
+    """Get a job's status and, once finished, its result.
+
+    With ``wait`` the request long-polls for up to that many seconds until
+    the job finishes, so clients need not poll in a tight loop.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        job = await db.lyrics_jobs.find_one({"job_id": job_id, "user_id": user.user_id}, {"_id": 0})
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        remaining = deadline - time.monotonic()
+        if job["status"] in JOB_FINAL_STATUSES or remaining <= 0:
+            return fast_json(job_view(job))
+        await asyncio.sleep(min(1.0, remaining))
 
 # ============ SONG CRUD ============
 
@@ -627,62 +2186,223 @@ async def create_song(song_data: SongCreate, user: User = Depends(get_current_us
         "used_in_final_track": False,
         "created_at": now.isoformat(),
         "updated_at": now.isoformat(),
-        "version_history": []
+        "lyrics_version": 1,
+        # Version 1 is written to song_versions on the first lyrics change
+        "unversioned": True,
     }
     
-    await db.songs.insert_one(song_doc)
+    # insert_one adds the ObjectId to the dict it is given, so pass a copy
+    await db.songs.insert_one(dict(song_doc))
+    return song_doc
+
+# Fields the library cards need; omits lyrics, full spec and history
+SONG_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "song_id": 1,
+    "title": 1,
+    "status": 1,
+    "used_in_final_track": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "song_spec_json.genre": 1,
+    "song_spec_json.subgenre": 1,
+}
+
+SONGS_PAGE_SIZE = int(os.environ.get("SONGS_PAGE_SIZE", "100"))
+SONGS_MAX_PAGE_SIZE = 1000
+
+def encode_song_cursor(position: Any) -> str:
+    raw = json.dumps(position).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_song_cursor(cursor: str) -> Any:
+    """Keyset cursors are ``[created_at, song_id]``; ranked search uses an int offset."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        if isinstance(position, list):
+            created_at, song_id = position
+            return str(created_at), str(song_id)
+        if isinstance(position, int) and position >= 0:
+            return position
+    except Exception:
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def weak_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return f'W/"{digest.hexdigest()}"'
+
+def song_etag(song_id: str, song: Dict[str, Any]) -> str:
+    return weak_etag(song_id, song.get("updated_at"), song.get("lyrics_version"))
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of ``etag`` against the request's If-None-Match."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in header.split(","))
+
+def conditional_headers(etag: str, last_modified: Optional[str] = None) -> Dict[str, str]:
+    # Per-user data: let the browser keep a private copy but always revalidate
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie, Authorization"}
+    if last_modified:
+        try:
+            headers["Last-Modified"] = format_datetime(_as_utc(datetime.fromisoformat(last_modified)), usegmt=True)
+        except ValueError:
+            pass
+    return headers
+
+def not_modified(etag: str, last_modified: Optional[str] = None, extra: Optional[str] = None) -> Response:
+    headers = conditional_headers(etag, last_modified)
+    if extra:
+        headers["X-Next-Cursor"] = extra
+    return Response(status_code=304, headers=headers)
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+@api_router.get("/songs", response_model=List[dict], response_class=FastJSONResponse)
+async def list_songs(
+    request: Request,
+    response: Response,
+    limit: int = Query(SONGS_PAGE_SIZE, ge=1, le=SONGS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: str = Query("full", pattern="^(full|summary)$"),
+    q: Optional[str] = Query(None, max_length=200),
+    status: Optional[str] = None,
+    used_in_final_track: Optional[bool] = None,
+    genre: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    user: User = Depends(get_current_user)
+):
+    """List songs for the current user, one page at a time.
+
+    Without ``q`` songs come newest first, paged on (created_at, song_id).
+    With ``q`` the title and lyrics text index is searched and results are
+    ranked by relevance. Either way, when more songs remain the cursor for
+    the next page is returned in the X-Next-Cursor header.
+    ``fields=summary`` omits lyrics, spec details and version history.
+    """
+    query: Dict[str, Any] = {"user_id": user.user_id}
+    if status:
+        query["status"] = status
+    if used_in_final_track is not None:
+        query["used_in_final_track"] = used_in_final_track
+    if genre:
+        query["song_spec_json.genre"] = genre
+    if created_from or created_to:
+        created_range = {}
+        if created_from:
+            created_range["$gte"] = _as_utc(created_from).isoformat()
+        if created_to:
+            created_range["$lte"] = _as_utc(created_to).isoformat()
+        query["created_at"] = created_range
+    
+    position = decode_song_cursor(cursor) if cursor else None
+    projection = dict(SONG_SUMMARY_PROJECTION if fields == "summary" else {"_id": 0})
+    search = q.strip() if q else ""
+    
+    if search:
+        if position is not None and not isinstance(position, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        offset = position or 0
+        query["$text"] = {"$search": search}
+        projection["score"] = {"$meta": "textScore"}
+        songs = await db.songs.find(query, projection).sort(
+            [("score", {"$meta": "textScore"}), ("song_id", -1)]
+        ).skip(offset).limit(limit + 1).to_list(limit + 1)
+        # Projected only so the sort works on older servers; not part of the summary
+        for song in songs:
+            song.pop("score", None)
+        next_position = offset + limit
+    else:
+        if isinstance(position, tuple):
+            created_at, song_id = position
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "song_id": {"$lt": song_id}},
+            ]
+        elif position is not None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        songs = await db.songs.find(query, projection).sort(
+            [("created_at", -1), ("song_id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+        next_position = None
+    
+    if len(songs) > limit:
+        songs = songs[:limit]
+        if next_position is None:
+            next_position = [songs[-1]["created_at"], songs[-1]["song_id"]]
+        response.headers["X-Next-Cursor"] = encode_song_cursor(next_position)
+    
+    # The page's identity is its songs and their revisions, so adds, edits
+    # and deletes within the page all change the tag.
+    etag = weak_etag(str(request.query_params), *(f"{s['song_id']}@{s.get('updated_at')}" for s in songs))
+    last_modified = max((s.get("updated_at") or "" for s in songs), default=None)
+    if etag_matches(request, etag):
+        return not_modified(etag, last_modified, extra=response.headers.get("X-Next-Cursor"))
+    response.headers.update(conditional_headers(etag, last_modified))
+    return fast_json(songs, headers=dict(response.headers))
+
+@api_router.get("/songs/{song_id}", response_model=dict, response_class=FastJSONResponse)
+async def get_song(song_id: str, request: Request, user: User = Depends(get_current_user)):
+    """Get a specific song.
+
+    Carries a weak ETag; a matching If-None-Match is answered with 304
+    after a version-only lookup, without loading or serializing the song.
+    """
+    query = {"song_id": song_id, "user_id": user.user_id}
+    if request.headers.get("If-None-Match"):
+        version = await db.songs.find_one(query, {"_id": 0, "updated_at": 1, "lyrics_version": 1})
+        if not version:
+            raise HTTPException(status_code=404, detail="Song not found")
+        etag = song_etag(song_id, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    
+    song = await db.songs.find_one(query, {"_id": 0})
     
-    result = await db.songs.find_one({"song_id": song_id}, {"_id": 0})
-    return result
-
-@api_router.get("/songs", response_model=List[dict])
-async def list_songs(user: User = Depends(get_current_user)):
-    """List all songs for the current user."""
-    songs = await db.songs.find(
-        {"user_id": user.user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
     
-    return songs
+    return fast_json(song, headers=conditional_headers(song_etag(song_id, song)))
 
-@api_router.get("/songs/{song_id}", response_model=dict)
-async def get_song(song_id: str, user: User = Depends(get_current_user)):
-    """Get a specific song."""
+@api_router.get("/songs/{song_id}/sections", response_model=dict, response_class=FastJSONResponse)
+async def get_song_sections(song_id: str, user: User = Depends(get_current_user)):
+    """Get the parsed section index (offsets, lines, token spans) of a song."""
     song = await db.songs.find_one(
         {"song_id": song_id, "user_id": user.user_id},
-        {"_id": 0}
+        {"_id": 0, "lyrics_text": 1, "updated_at": 1}
     )
     
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
     
-    return song
+    parsed = parse_cache.get(song["lyrics_text"], key=(song_id, song["updated_at"]))
+    return fast_json({"song_id": song_id, "updated_at": song["updated_at"], **parsed.to_dict()})
 
 @api_router.put("/songs/{song_id}", response_model=dict)
 async def update_song(song_id: str, song_update: SongUpdate, user: User = Depends(get_current_user)):
-    """Update a song."""
-    song = await db.songs.find_one(
-        {"song_id": song_id, "user_id": user.user_id},
-        {"_id": 0}
-    )
-    
-    if not song:
-        raise HTTPException(status_code=404, detail="Song not found")
-    
+    """Update a song.
+
+    Runs as a single find_one_and_update, so concurrent autosaves cannot
+    interleave a read-modify-write. When the lyrics change, the pipeline
+    bumps lyrics_version atomically and the new version is appended to
+    song_versions as a line diff against the lyrics it replaced.
+    """
+    now = datetime.now(timezone.utc).isoformat()
     update_data = {}
     
-    # Save current version to history if lyrics changed
-    if song_update.lyrics_text is not None and song_update.lyrics_text != song.get("lyrics_text"):
-        version_history = song.get("version_history", [])
-        version_history.append({
-            "lyrics_text": song.get("lyrics_text"),
-            "saved_at": datetime.now(timezone.utc).isoformat()
-        })
-        # Keep only last 3 versions
-        if len(version_history) > 3:
-            version_history = version_history[-3:]
-        update_data["version_history"] = version_history
-    
     if song_update.title is not None:
         update_data["title"] = song_update.title
     if song_update.lyrics_text is not None:
@@ -694,16 +2414,120 @@ async def update_song(song_id: str, song_update: SongUpdate, user: User = Depend
     if song_update.used_in_final_track is not None:
         update_data["used_in_final_track"] = song_update.used_in_final_track
     
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_data["updated_at"] = now
     
-    await db.songs.update_one(
-        {"song_id": song_id},
-        {"$set": update_data}
+    pipeline = []
+    if song_update.lyrics_text is not None:
+        changed = {"$ne": ["$lyrics_text", {"$literal": song_update.lyrics_text}]}
+        # Songs saved before versioning keep up to 3 inline copies; those
+        # become versions 1..k and the stored lyrics version k+1.
+        base_version = {"$ifNull": [
+            "$lyrics_version",
+            {"$add": [{"$size": {"$ifNull": ["$version_history", []]}}, 1]}
+        ]}
+        pipeline.append({"$set": {
+            "lyrics_version": {"$cond": [changed, {"$add": [base_version, 1]}, "$lyrics_version"]},
+            "version_history": {"$cond": [changed, "$$REMOVE", "$version_history"]},
+            "unversioned": {"$cond": [changed, "$$REMOVE", "$unversioned"]},
+        }})
+    # $literal keeps user text such as "$100" from being read as a field path
+    pipeline.append({"$set": {key: {"$literal": value} for key, value in update_data.items()}})
+    
+    previous = await db.songs.find_one_and_update(
+        {"song_id": song_id, "user_id": user.user_id},
+        pipeline,
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
     )
     
-    updated_song = await db.songs.find_one({"song_id": song_id}, {"_id": 0})
+    if not previous:
+        raise HTTPException(status_code=404, detail="Song not found")
+    
+    updated_song = {**previous, **update_data}
+    if song_update.lyrics_text is not None and song_update.lyrics_text != previous.get("lyrics_text"):
+        version_docs = lyrics_change_version_docs(song_id, user.user_id, previous, song_update.lyrics_text, now)
+        await append_versions(song_id, user.user_id, version_docs)
+        
+        updated_song["lyrics_version"] = version_docs[-1]["version"]
+        updated_song.pop("version_history", None)
+        updated_song.pop("unversioned", None)
+    
     return updated_song
 
+@api_router.patch("/songs/{song_id}", response_model=dict)
+async def patch_song(song_id: str, song_patch: SongPatch, user: User = Depends(get_current_user)):
+    """Apply a line-level lyrics diff against ``base_version`` (autosave).
+
+    The write only lands if the song is still at ``base_version``; a stale
+    base, including one that loses a race with another save, gets a 409
+    carrying the current version so the client can rebase.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    update_data: Dict[str, Any] = {}
+    if song_patch.title is not None:
+        update_data["title"] = song_patch.title
+    if song_patch.status is not None:
+        update_data["status"] = song_patch.status
+    if song_patch.used_in_final_track is not None:
+        update_data["used_in_final_track"] = song_patch.used_in_final_track
+    
+    version_docs = []
+    unset = {}
+    query: Dict[str, Any] = {"song_id": song_id, "user_id": user.user_id}
+    if song_patch.ops:
+        song = await db.songs.find_one(
+            query, {"_id": 0, "lyrics_text": 1, "lyrics_version": 1, "version_history": 1, "unversioned": 1, "updated_at": 1}
+        )
+        if not song:
+            raise HTTPException(status_code=404, detail="Song not found")
+        current_version = current_lyrics_version(song)
+        if current_version != song_patch.base_version:
+            raise stale_revision(current_version)
+        
+        old_lines = (song.get("lyrics_text") or "").split("\n")
+        previous_end = 0
+        for start, end, _ in song_patch.ops:
+            if not previous_end <= start <= end <= len(old_lines):
+                raise HTTPException(status_code=422, detail="Diff ops must be ordered, non-overlapping and in range")
+            previous_end = end
+        lyrics_text = "\n".join(apply_line_diff(old_lines, [list(op) for op in song_patch.ops]))
+        
+        if lyrics_text != song.get("lyrics_text"):
+            version_docs = lyrics_change_version_docs(song_id, user.user_id, song, lyrics_text, now)
+            update_data["lyrics_text"] = lyrics_text
+            update_data["lyrics_version"] = version_docs[-1]["version"]
+            unset["version_history"] = ""
+            unset["unversioned"] = ""
+        # Compare-and-set: only matches if nobody saved since we read
+        query["lyrics_version"] = song.get("lyrics_version")
+    
+    update_data["updated_at"] = now
+    update: Dict[str, Any] = {"$set": update_data}
+    if unset:
+        update["$unset"] = unset
+    
+    updated = await db.songs.find_one_and_update(
+        query,
+        update,
+        projection={"_id": 0, "song_id": 1, "title": 1, "status": 1, "used_in_final_track": 1, "lyrics_version": 1, "updated_at": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if not updated:
+        if song_patch.ops:
+            latest = await db.songs.find_one(
+                {"song_id": song_id, "user_id": user.user_id},
+                {"_id": 0, "lyrics_version": 1, "version_history": 1}
+            )
+            if latest:
+                raise stale_revision(current_lyrics_version(latest))
+        raise HTTPException(status_code=404, detail="Song not found")
+    
+    if version_docs:
+        await append_versions(song_id, user.user_id, version_docs)
+    
+    return updated
+
 @api_router.delete("/songs/{song_id}")
 async def delete_song(song_id: str, user: User = Depends(get_current_user)):
     """Delete a song."""
@@ -714,6 +2538,7 @@ async def delete_song(song_id: str, user: User = Depends(get_current_user)):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Song not found")
     
+    await db.song_versions.delete_many({"song_id": song_id, "user_id": user.user_id})
     return {"message": "Song deleted"}
 
 @api_router.post("/songs/{song_id}/duplicate", response_model=dict)
@@ -721,7 +2546,7 @@ async def duplicate_song(song_id: str, user: User = Depends(get_current_user)):
     """Duplicate a song."""
     song = await db.songs.find_one(
         {"song_id": song_id, "user_id": user.user_id},
-        {"_id": 0}
+        {"_id": 0, "title": 1, "lyrics_text": 1, "song_spec_json": 1}
     )
     
     if not song:
@@ -740,13 +2565,294 @@ async def duplicate_song(song_id: str, user: User = Depends(get_current_user)):
         "used_in_final_track": False,
         "created_at": now.isoformat(),
         "updated_at": now.isoformat(),
-        "version_history": []
+        "lyrics_version": 1,
+        "unversioned": True,
     }
     
-    await db.songs.insert_one(new_song)
-    
-    result = await db.songs.find_one({"song_id": new_song_id}, {"_id": 0})
-    return result
+    await db.songs.insert_one(dict(new_song))
+    return new_song
+
+# ============ VERSION HISTORY ============
+
+# Every Nth version is stored whole so reconstruction replays at most N-1 diffs
+VERSION_SNAPSHOT_INTERVAL = int(os.environ.get("VERSION_SNAPSHOT_INTERVAL", "20"))
+
+def diff_lines(old: List[str], new: List[str]) -> List[list]:
+    """Line diff as ``[start, end, replacement_lines]`` ops against ``old``."""
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [
+        [i1, i2, new[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+def apply_line_diff(old: List[str], ops: List[list]) -> List[str]:
+    lines: List[str] = []
+    cursor = 0
+    for start, end, replacement in ops:
+        lines.extend(old[cursor:start])
+        lines.extend(replacement)
+        cursor = end
+    lines.extend(old[cursor:])
+    return lines
+
+def build_version_doc(song_id: str, user_id: str, version: int, lyrics: str, previous: Optional[str], saved_at: str) -> Dict[str, Any]:
+    lines = lyrics.split("\n")
+    doc = {
+        "song_id": song_id,
+        "user_id": user_id,
+        "version": version,
+        "saved_at": saved_at,
+        "line_count": len(lines),
+    }
+    if previous is None or (version - 1) % VERSION_SNAPSHOT_INTERVAL == 0:
+        doc["snapshot"] = lines
+    else:
+        doc["ops"] = diff_lines(previous.split("\n"), lines)
+    return doc
+
+def current_lyrics_version(song: Dict[str, Any]) -> int:
+    """Version number of the song's current lyrics.
+
+    Songs saved before versioning have no counter; their current lyrics
+    count as the version after their inline history copies.
+    """
+    if "lyrics_version" in song:
+        return song["lyrics_version"]
+    return len(song.get("version_history") or []) + 1
+
+def lyrics_change_version_docs(song_id: str, user_id: str, previous: Dict[str, Any], lyrics_text: str, saved_at: str) -> List[Dict[str, Any]]:
+    """Version documents to insert when ``previous`` changes to ``lyrics_text``.
+
+    Normally this is one diff against the previous lyrics. Lyrics that were
+    never written to song_versions are written first, as the versions they
+    replace: the inline history and current lyrics of a song saved before
+    versioning, or the current lyrics of an ``unversioned`` song (new or
+    duplicated songs, and songs whose last version insert failed).
+    """
+    chain = []
+    if "lyrics_version" not in previous:
+        chain = [(v.get("lyrics_text") or "", v.get("saved_at") or saved_at) for v in previous.get("version_history") or []]
+    if "lyrics_version" not in previous or previous.get("unversioned"):
+        chain.append((previous.get("lyrics_text") or "", previous.get("updated_at") or saved_at))
+    base_version = current_lyrics_version(previous)
+    
+    docs = []
+    prior = None
+    for version, (text, text_saved_at) in enumerate(chain, start=base_version - len(chain) + 1):
+        docs.append(build_version_doc(song_id, user_id, version, text, prior, text_saved_at))
+        prior = text
+    docs.append(build_version_doc(
+        song_id, user_id, base_version + 1, lyrics_text, previous.get("lyrics_text") or "", saved_at
+    ))
+    return docs
+
+VERSION_WRITE_ATTEMPTS = 3
+
+async def append_versions(song_id: str, user_id: str, version_docs: List[Dict[str, Any]]):
+    """Insert version documents after the song write that created them.
+
+    The two writes aren't atomic. Failed inserts are retried; if they still
+    fail, the song is flagged ``unversioned`` so its next save writes the
+    current lyrics as a snapshot first, and the save itself still succeeds.
+    """
+    for attempt in range(VERSION_WRITE_ATTEMPTS):
+        try:
+            await db.song_versions.insert_many(version_docs, ordered=False)
+            return
+        except BulkWriteError as e:
+            # Duplicates are docs an earlier attempt already wrote
+            if all(err.get("code") == 11000 for err in e.details.get("writeErrors", [])) and not e.details.get("writeConcernErrors"):
+                return
+            error: Exception = e
+        except PyMongoError as e:
+            error = e
+        await asyncio.sleep(0.1 * 2 ** attempt)
+    logger.error(f"Could not record versions {[d['version'] for d in version_docs]} of {song_id}: {error}")
+    try:
+        await db.songs.update_one({"song_id": song_id, "user_id": user_id}, {"$set": {"unversioned": True}})
+    except PyMongoError as e:
+        logger.error(f"Could not flag version gap on {song_id}: {e}")
+
+def stale_revision(current_version: int) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Song was saved elsewhere; rebase on the current version", "current_version": current_version}
+    )
+
+async def materialize_version(song_id: str, user_id: str, version: int) -> Optional[Dict[str, Any]]:
+    """Rebuild a version from the nearest snapshot at or before it.
+
+    Diffs only apply to the version directly before them, so a missing
+    version between the snapshot and the target is an error rather than a
+    silently wrong result.
+    """
+    base = await db.song_versions.find_one(
+        {"song_id": song_id, "user_id": user_id, "version": {"$lte": version}, "snapshot": {"$exists": True}},
+        {"_id": 0},
+        sort=[("version", -1)]
+    )
+    if not base:
+        return None
+    
+    lines = base["snapshot"]
+    latest = base
+    if base["version"] < version:
+        deltas = db.song_versions.find(
+            {"song_id": song_id, "user_id": user_id, "version": {"$gt": base["version"], "$lte": version}},
+            {"_id": 0, "version": 1, "saved_at": 1, "ops": 1, "snapshot": 1}
+        ).sort("version", 1)
+        async for doc in deltas:
+            if "snapshot" in doc:
+                lines = doc["snapshot"]
+            elif doc["version"] != latest["version"] + 1:
+                logger.error(f"Version history of {song_id} is missing versions {latest['version'] + 1}-{doc['version'] - 1}")
+                raise HTTPException(status_code=500, detail="Version history is incomplete")
+            else:
+                lines = apply_line_diff(lines, doc["ops"])
+            latest = doc
+    if latest["version"] != version:
+        return None
+    return {"version": version, "saved_at": latest["saved_at"], "lyrics_text": "\n".join(lines)}
+
+@api_router.get("/songs/{song_id}/versions", response_model=List[dict], response_class=FastJSONResponse)
+async def list_song_versions(
+    song_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[int] = None,
+    user: User = Depends(get_current_user)
+):
+    """List saved lyrics versions, newest first (page with ``before``)."""
+    query: Dict[str, Any] = {"song_id": song_id, "user_id": user.user_id}
+    if before is not None:
+        query["version"] = {"$lt": before}
+    versions = await db.song_versions.find(
+        query,
+        {"_id": 0, "version": 1, "saved_at": 1, "line_count": 1}
+    ).sort("version", -1).to_list(limit)
+    
+    if not versions and before is None:
+        song = await db.songs.find_one(
+            {"song_id": song_id, "user_id": user.user_id},
+            {"_id": 0, "lyrics_text": 1, "lyrics_version": 1, "updated_at": 1}
+        )
+        if not song:
+            raise HTTPException(status_code=404, detail="Song not found")
+        if "lyrics_version" in song:
+            # Never edited: its only version still lives on the song
+            versions = [{
+                "version": song["lyrics_version"],
+                "saved_at": song["updated_at"],
+                "line_count": len((song.get("lyrics_text") or "").split("\n")),
+            }]
+    
+    return fast_json(versions)
+
+@api_router.get("/songs/{song_id}/versions/{version}", response_model=dict, response_class=FastJSONResponse)
+async def get_song_version(song_id: str, version: int, user: User = Depends(get_current_user)):
+    """Materialize the lyrics of one saved version."""
+    result = await materialize_version(song_id, user.user_id, version)
+    if not result:
+        # The current lyrics of an unversioned song aren't in song_versions yet
+        song = await db.songs.find_one(
+            {"song_id": song_id, "user_id": user.user_id, "lyrics_version": version},
+            {"_id": 0, "lyrics_text": 1, "updated_at": 1}
+        )
+        if not song:
+            raise HTTPException(status_code=404, detail="Version not found")
+        result = {"version": version, "saved_at": song["updated_at"], "lyrics_text": song.get("lyrics_text") or ""}
+    return fast_json({"song_id": song_id, **result})
+
+# ============ INDEXES ============
+
+# (collection, keys, options) for every index the queries above rely on
+INDEX_SPECS = [
+    ("users", [("user_id", 1)], {"name": "users_user_id", "unique": True}),
+    ("users", [("email", 1)], {"name": "users_email", "unique": True}),
+    ("user_sessions", [("session_token", 1)], {"name": "user_sessions_token", "unique": True}),
+    # Sessions are reaped by Mongo once expires_at (a BSON date) has passed
+    ("user_sessions", [("expires_at", 1)], {"name": "user_sessions_expiry_ttl", "expireAfterSeconds": 0}),
+    ("songs", [("song_id", 1)], {"name": "songs_song_id", "unique": True}),
+    ("songs", [("user_id", 1), ("created_at", -1), ("song_id", -1)], {"name": "songs_user_created"}),
+    ("songs", [("user_id", 1), ("status", 1), ("created_at", -1)], {"name": "songs_user_status_created"}),
+    # user_id prefix: every $text query filters by user, so searches only
+    # scan that user's postings instead of the whole catalog
+    ("songs", [("user_id", 1), ("title", "text"), ("lyrics_text", "text")], {
+        "name": "songs_text_search",
+        "weights": {"title": 5, "lyrics_text": 1},
+        "default_language": "english",
+    }),
+    ("song_versions", [("song_id", 1), ("version", -1)], {"name": "song_versions_song_version", "unique": True}),
+    ("llm_response_cache", [("key", 1)], {"name": "llm_response_cache_key", "unique": True}),
+    ("llm_response_cache", [("expires_at", 1)], {"name": "llm_response_cache_ttl", "expireAfterSeconds": 0}),
+    ("llm_usage", [("period", 1), ("user_id", 1), ("endpoint", 1), ("model", 1)], {"name": "llm_usage_row", "unique": True}),
+    ("llm_usage", [("user_id", 1), ("period", -1)], {"name": "llm_usage_user_period"}),
+    ("lyrics_jobs", [("job_id", 1)], {"name": "lyrics_jobs_job_id", "unique": True}),
+    ("lyrics_jobs", [("status", 1), ("available_at", 1)], {"name": "lyrics_jobs_claim"}),
+    ("lyrics_jobs", [("status", 1), ("lease_expires_at", 1)], {"name": "lyrics_jobs_lease"}),
+    # Finished jobs get expires_at and are reaped once their results are stale
+    ("lyrics_jobs", [("expires_at", 1)], {"name": "lyrics_jobs_ttl", "expireAfterSeconds": 0}),
+]
+
+class IndexBootstrap:
+    """Idempotently creates INDEX_SPECS at startup and records the outcome.
+
+    create_index is a no-op for an index that already exists with the same
+    options, so this is safe on every boot. One failing index (e.g. a unique
+    index over duplicate data) is reported without blocking the rest.
+    """
+
+    def __init__(self, specs: List[tuple]):
+        self.specs = specs
+        self.task: Optional[asyncio.Task] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.results: Dict[str, Dict[str, Any]] = {
+            options["name"]: {"collection": collection, "status": "pending"}
+            for collection, _, options in specs
+        }
+        self.errors: Dict[str, str] = {}
+
+    async def run(self, database):
+        self.started_at = datetime.now(timezone.utc)
+        for collection, keys, options in self.specs:
+            result = self.results[options["name"]]
+            result["status"] = "building"
+            started = time.monotonic()
+            try:
+                await database[collection].create_index(keys, **options)
+                result["status"] = "ok"
+            except Exception as e:
+                logger.error(f"Index {options['name']} on {collection} failed: {e}")
+                result["status"] = "error"
+                # Messages can quote document values (E11000 includes the
+                # duplicate key), so only the code and class are public
+                result["error_code"] = getattr(e, "code", None)
+                result["error_name"] = type(e).__name__
+                self.errors[options["name"]] = str(e)
+            result["seconds"] = round(time.monotonic() - started, 3)
+        self.finished_at = datetime.now(timezone.utc)
+
+    def status(self, detail: bool = False) -> Dict[str, Any]:
+        """Overall and per-index build state; ``detail`` adds error messages."""
+        states = [r["status"] for r in self.results.values()]
+        if "error" in states:
+            overall = "error"
+        elif all(state == "ok" for state in states):
+            overall = "ok"
+        else:
+            overall = "building" if self.started_at else "pending"
+        return {
+            "status": overall,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "indexes": {
+                name: {**result, "error": self.errors[name]} if detail and name in self.errors else result
+                for name, result in self.results.items()
+            },
+        }
+
+index_bootstrap = IndexBootstrap(INDEX_SPECS)
 
 # ============ HEALTH CHECK ============
 
@@ -758,17 +2864,111 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+# ============ DIAGNOSTICS ============
+
+@api_router.get("/metrics")
+async def prometheus_metrics():
+    """Request and per-stage latency histograms in Prometheus text format."""
+    return Response(content=render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_router.get("/diagnostics/session-cache")
+async def session_cache_stats(admin: User = Depends(require_admin)):
+    """Hit, miss and eviction counters for the in-process session cache."""
+    return session_cache.stats()
+
+@api_router.get("/diagnostics/llm-cache")
+async def llm_cache_stats(admin: User = Depends(require_admin)):
+    """Hit, miss and eviction counters for the LLM response cache."""
+    return response_cache.stats()
+
+@api_router.get("/diagnostics/single-flight")
+async def single_flight_stats(admin: User = Depends(require_admin)):
+    """Counters for deduplicated concurrent LLM requests."""
+    return llm_single_flight.stats()
+
+@api_router.get("/diagnostics/llm-admission")
+async def llm_admission_stats(admin: User = Depends(require_admin)):
+    """Queue depth, wait time and rejection counters for LLM admission control."""
+    return llm_admission.stats()
+
+@api_router.get("/diagnostics/llm-policy")
+async def llm_policy_stats(admin: User = Depends(require_admin)):
+    """Retry, timeout and hedging counters for upstream LLM calls."""
+    return llm_call_policy.stats()
+
+@api_router.get("/diagnostics/lyrics-jobs")
+async def lyrics_job_stats(admin: User = Depends(require_admin)):
+    """Counters for the lyrics job workers in this process."""
+    return job_workers.stats()
+
+@api_router.get("/diagnostics/prompt-cache")
+async def prompt_cache_stats(admin: User = Depends(require_admin)):
+    """Cached vs uncached input tokens per endpoint, as reported upstream."""
+    return prompt_cache_meter.stats()
+
+@api_router.get("/diagnostics/indexes")
+async def index_status():
+    """Build status of the indexes created at startup.
+
+    Public, for readiness checks, so failures carry only an error code and
+    name; the database's messages are served at /admin/indexes.
+    """
+    return index_bootstrap.status()
+
+@api_router.get("/admin/indexes")
+async def index_status_detail(admin: User = Depends(require_admin)):
+    """Index build status including the database's error messages."""
+    return index_bootstrap.status(detail=True)
+
 # Include the router in the main app
 app.include_router(api_router)
 
+if _env_flag("COMPRESSION_ENABLED", "true"):
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", "1024")),
+        gzip_level=int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4")),
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
+# Outermost, so request timings include every other middleware
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def start_llm_gateway():
+    await llm_gateway.start()
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    # Build in the background so a slow build on a large collection
+    # does not hold up startup; progress is visible in diagnostics.
+    index_bootstrap.task = asyncio.create_task(index_bootstrap.run(db))
+
+@app.on_event("startup")
+async def load_pronunciation_table():
+    # Map (or build, on first deploy) the table off the event loop
+    await asyncio.to_thread(prosody.get_table)
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_workers.start()
+
+@app.on_event("startup")
+async def start_usage_meter():
+    usage_meter.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await job_workers.stop()
+    await usage_meter.stop()
+    await llm_gateway.close()
     client.close()
@@ -26,6 +26,69 @@ class TestHealthEndpoints:
         data = response.json()
         assert "message" in data
 
+    def test_session_cache_stats_without_auth(self):
+        """Test /api/diagnostics/session-cache returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/session-cache")
+        assert response.status_code == 401
+
+    def test_prometheus_metrics(self):
+        """Test /api/metrics exposes request and stage histograms"""
+        requests.get(f"{BASE_URL}/api/health")
+        response = requests.get(f"{BASE_URL}/api/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "lyriclab_request_duration_seconds_bucket" in response.text
+
+    def test_llm_admission_stats_without_auth(self):
+        """Test /api/diagnostics/llm-admission returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/llm-admission")
+        assert response.status_code == 401
+    
+    def test_llm_policy_stats_without_auth(self):
+        """Test /api/diagnostics/llm-policy returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/llm-policy")
+        assert response.status_code == 401
+    
+    def test_admin_usage_without_auth(self):
+        """Test /api/admin/usage returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/admin/usage")
+        assert response.status_code == 401
+    
+    def test_prompt_cache_stats_without_auth(self):
+        """Test /api/diagnostics/prompt-cache returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/prompt-cache")
+        assert response.status_code == 401
+
+    def test_llm_cache_stats_without_auth(self):
+        """Test /api/diagnostics/llm-cache returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/llm-cache")
+        assert response.status_code == 401
+
+    def test_single_flight_stats_without_auth(self):
+        """Test /api/diagnostics/single-flight returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/single-flight")
+        assert response.status_code == 401
+
+    def test_lyrics_job_stats_without_auth(self):
+        """Test /api/diagnostics/lyrics-jobs returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/lyrics-jobs")
+        assert response.status_code == 401
+
+    def test_index_status(self):
+        """Test /api/diagnostics/indexes reports startup index builds"""
+        response = requests.get(f"{BASE_URL}/api/diagnostics/indexes")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] in ("pending", "building", "ok", "error")
+        assert "user_sessions_token" in data["indexes"]
+        # Raw database messages are admin-only
+        assert all("error" not in index for index in data["indexes"].values())
+
+    def test_admin_indexes_without_auth(self):
+        """Test /api/admin/indexes returns 401 without auth"""
+        response = requests.get(f"{BASE_URL}/api/admin/indexes")
+        assert response.status_code == 401
+
 
 class TestAuthEndpoints:
     """Authentication endpoint tests"""
@@ -85,6 +148,83 @@ class TestSongsCRUD:
         data = response.json()
         assert isinstance(data, list)
     
+    def test_list_songs_summary_page(self, auth_headers):
+        """Test /api/songs?fields=summary&limit=1 returns one lean page"""
+        response = requests.get(
+            f"{BASE_URL}/api/songs",
+            params={"fields": "summary", "limit": 1},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) <= 1
+        for song in data:
+            assert "lyrics_text" not in song
+            assert "version_history" not in song
+        
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor:
+            next_page = requests.get(
+                f"{BASE_URL}/api/songs",
+                params={"fields": "summary", "limit": 1, "cursor": cursor},
+                headers=auth_headers
+            )
+            assert next_page.status_code == 200
+            assert next_page.json()[0]["song_id"] != data[0]["song_id"]
+    
+    def test_list_songs_gzip(self, auth_headers):
+        """Test a large /api/songs response is gzipped when the client accepts it"""
+        song_ids = []
+        for i in range(3):
+            payload = {
+                "title": f"TEST_Song_Gzip_{i}",
+                "lyrics_text": "[VERSE 1]\n" + "Test lyrics line that repeats\n" * 80,
+                "song_spec": {"genre": "Pop"}
+            }
+            create_response = requests.post(f"{BASE_URL}/api/songs", json=payload, headers=auth_headers)
+            assert create_response.status_code == 201
+            song_ids.append(create_response.json()["song_id"])
+        
+        headers = {**auth_headers, "Accept-Encoding": "gzip"}
+        response = requests.get(f"{BASE_URL}/api/songs", headers=headers)
+        assert response.status_code == 200
+        assert response.headers.get("Content-Encoding") == "gzip"
+        # requests decodes the body, so this checks the gzip stream is valid JSON
+        listed = [s["song_id"] for s in response.json()]
+        assert set(song_ids) <= set(listed)
+        
+        # Responses under COMPRESSION_MIN_SIZE go out as is
+        small = requests.get(f"{BASE_URL}/api/health", headers={"Accept-Encoding": "gzip"})
+        assert small.status_code == 200
+        assert "Content-Encoding" not in small.headers
+        assert small.json()["status"] == "healthy"
+        
+        # Cleanup
+        for song_id in song_ids:
+            requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
+    
+    def test_search_songs(self, auth_headers):
+        """Test /api/songs?q= finds songs by title via the text index"""
+        payload = {
+            "title": "TEST_Searchable Zanzibar Anthem",
+            "lyrics_text": "[VERSE 1]\nTest lyrics line",
+            "song_spec": {"genre": "Pop"}
+        }
+        create_response = requests.post(f"{BASE_URL}/api/songs", json=payload, headers=auth_headers)
+        assert create_response.status_code == 201
+        song_id = create_response.json()["song_id"]
+        
+        response = requests.get(
+            f"{BASE_URL}/api/songs",
+            params={"q": "zanzibar", "status": "draft", "genre": "Pop"},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert song_id in [s["song_id"] for s in response.json()]
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
+    
     def test_create_song(self, auth_headers):
         """Test POST /api/songs creates a song"""
         payload = {
@@ -129,6 +269,26 @@ class TestSongsCRUD:
         # Cleanup
         requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
     
+    def test_get_song_sections(self, auth_headers):
+        """Test GET /api/songs/{id}/sections returns the parsed section index"""
+        payload = {
+            "title": "TEST_Song_Sections",
+            "lyrics_text": "[VERSE 1]\nFirst line here\nSecond line here\n\n[CHORUS]\nSing it loud",
+            "song_spec": {"genre": "Pop"}
+        }
+        create_response = requests.post(f"{BASE_URL}/api/songs", json=payload, headers=auth_headers)
+        assert create_response.status_code == 201
+        song_id = create_response.json()["song_id"]
+        
+        response = requests.get(f"{BASE_URL}/api/songs/{song_id}/sections", headers=auth_headers)
+        assert response.status_code == 200
+        sections = response.json()["sections"]
+        assert [s["header"] for s in sections] == ["VERSE 1", "CHORUS"]
+        assert len(sections[0]["lines"]) == 2
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
+    
     def test_update_song(self, auth_headers):
         """Test PUT /api/songs/{id} updates a song"""
         # Create first
@@ -157,6 +317,77 @@ class TestSongsCRUD:
         # Cleanup
         requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
     
+    def test_song_versions(self, auth_headers):
+        """Test every lyrics save is listed and can be materialized"""
+        create_payload = {"title": "TEST_Song_Versions", "lyrics_text": "[VERSE 1]\nLine one\nLine two", "song_spec": {}}
+        create_response = requests.post(f"{BASE_URL}/api/songs", json=create_payload, headers=auth_headers)
+        song_id = create_response.json()["song_id"]
+        
+        # Version 1 is served from the song until the first edit writes it
+        versions = requests.get(f"{BASE_URL}/api/songs/{song_id}/versions", headers=auth_headers).json()
+        assert [v["version"] for v in versions] == [1]
+        response = requests.get(f"{BASE_URL}/api/songs/{song_id}/versions/1", headers=auth_headers)
+        assert response.json()["lyrics_text"] == create_payload["lyrics_text"]
+        
+        edits = ["[VERSE 1]\nLine one\nLine 2", "[VERSE 1]\nLine one\nLine 2\nLine three", "[CHORUS]\nLine 2"]
+        for lyrics in edits:
+            response = requests.put(f"{BASE_URL}/api/songs/{song_id}", json={"lyrics_text": lyrics}, headers=auth_headers)
+            assert response.status_code == 200
+        assert response.json()["lyrics_version"] == 4
+        
+        versions = requests.get(f"{BASE_URL}/api/songs/{song_id}/versions", headers=auth_headers).json()
+        assert [v["version"] for v in versions] == [4, 3, 2, 1]
+        
+        for version, expected in zip([1, 2, 3, 4], [create_payload["lyrics_text"]] + edits):
+            response = requests.get(f"{BASE_URL}/api/songs/{song_id}/versions/{version}", headers=auth_headers)
+            assert response.status_code == 200
+            assert response.json()["lyrics_text"] == expected
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
+    
+    def test_patch_song_lyrics_diff(self, auth_headers):
+        """Test PATCH /api/songs/{id} applies a line diff and rejects stale revisions"""
+        create_payload = {"title": "TEST_Song_Patch", "lyrics_text": "[VERSE 1]\nLine one\nLine two", "song_spec": {}}
+        create_response = requests.post(f"{BASE_URL}/api/songs", json=create_payload, headers=auth_headers)
+        song_id = create_response.json()["song_id"]
+        
+        patch = {"base_version": 1, "ops": [[2, 3, ["Line 2", "Line three"]]]}
+        response = requests.patch(f"{BASE_URL}/api/songs/{song_id}", json=patch, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["lyrics_version"] == 2
+        
+        song = requests.get(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers).json()
+        assert song["lyrics_text"] == "[VERSE 1]\nLine one\nLine 2\nLine three"
+        
+        # Same base again is now stale
+        stale = requests.patch(f"{BASE_URL}/api/songs/{song_id}", json=patch, headers=auth_headers)
+        assert stale.status_code == 409
+        assert stale.json()["detail"]["current_version"] == 2
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
+    
+    def test_get_song_conditional(self, auth_headers):
+        """Test GET /api/songs/{id} answers a matching If-None-Match with 304"""
+        create_payload = {"title": "TEST_Song_ETag", "lyrics_text": "[VERSE 1]\nLine one", "song_spec": {}}
+        create_response = requests.post(f"{BASE_URL}/api/songs", json=create_payload, headers=auth_headers)
+        song_id = create_response.json()["song_id"]
+        
+        first = requests.get(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
+        etag = first.headers["ETag"]
+        
+        cached = requests.get(f"{BASE_URL}/api/songs/{song_id}", headers={**auth_headers, "If-None-Match": etag})
+        assert cached.status_code == 304
+        
+        requests.put(f"{BASE_URL}/api/songs/{song_id}", json={"title": "TEST_Song_ETag_2"}, headers=auth_headers)
+        changed = requests.get(f"{BASE_URL}/api/songs/{song_id}", headers={**auth_headers, "If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/songs/{song_id}", headers=auth_headers)
+    
     def test_delete_song(self, auth_headers):
         """Test DELETE /api/songs/{id} removes a song"""
         # Create first
@@ -226,6 +457,24 @@ class TestLyricsEndpoints:
         response = requests.post(f"{BASE_URL}/api/lyrics/rewrite", json=payload)
         assert response.status_code == 401
     
+    def test_generate_stream_without_auth(self):
+        """Test /api/lyrics/generate/stream returns 401 without auth"""
+        payload = {"song_spec": {"topic": "Test"}}
+        response = requests.post(f"{BASE_URL}/api/lyrics/generate/stream", json=payload)
+        assert response.status_code == 401
+    
+    def test_rewrite_stream_without_auth(self):
+        """Test /api/lyrics/rewrite/stream returns 401 without auth"""
+        payload = {"song_spec": {}, "current_lyrics": "Test"}
+        response = requests.post(f"{BASE_URL}/api/lyrics/rewrite/stream", json=payload)
+        assert response.status_code == 401
+    
+    def test_variations_stream_without_auth(self):
+        """Test /api/lyrics/variations/stream returns 401 without auth"""
+        payload = {"song_spec": {}, "current_lyrics": "Test", "count": 2}
+        response = requests.post(f"{BASE_URL}/api/lyrics/variations/stream", json=payload)
+        assert response.status_code == 401
+    
     def test_rewrite_section_without_auth(self):
         """Test /api/lyrics/rewrite-section returns 401 without auth"""
         payload = {"song_spec": {}, "current_lyrics": "Test", "section": "Verse 1"}
@@ -268,6 +517,122 @@ class TestLyricsEndpoints:
         assert "lyrics" in data
         print(f"Transform response: {data.get('lyrics', '')[:100]}...")
 
+    # CRLF lyrics with a preamble and a repeated chorus, as separate pieces
+    SCOPED_PREAMBLE = "Title: Open Road\r\n\r\n"
+    SCOPED_VERSE_1 = "[VERSE 1]\r\nWalking down the road\r\nCarrying a heavy load"
+    SCOPED_CHORUS = "[CHORUS]\r\nSing it loud tonight\r\nEverything's alright"
+    SCOPED_VERSE_2 = "[VERSE 2]\r\nMorning comes around\r\nFeet back on the ground"
+    SCOPED_BRIDGE = "[BRIDGE]\r\nHold on, hold on"
+    SCOPED_GAP = "\r\n\r\n"
+    
+    def scoped_lyrics(self):
+        return self.SCOPED_PREAMBLE + self.SCOPED_GAP.join([
+            self.SCOPED_VERSE_1, self.SCOPED_CHORUS, self.SCOPED_VERSE_2,
+            self.SCOPED_CHORUS, self.SCOPED_BRIDGE
+        ]) + "\r\n"
+    
+    def test_rewrite_section_keeps_other_sections(self, auth_headers):
+        """Test rewriting a repeated chorus leaves every other byte of the lyrics untouched"""
+        payload = {
+            "song_spec": {"topic": "Travel", "genre": "Country"},
+            "current_lyrics": self.scoped_lyrics(),
+            "section": "Chorus"
+        }
+        response = requests.post(f"{BASE_URL}/api/lyrics/rewrite-section", json=payload, headers=auth_headers, timeout=60)
+        assert response.status_code == 200
+        lyrics = response.json()["lyrics"]
+        
+        head = self.SCOPED_PREAMBLE + self.SCOPED_VERSE_1 + self.SCOPED_GAP + "[CHORUS]\r\n"
+        middle = self.SCOPED_GAP + self.SCOPED_VERSE_2 + self.SCOPED_GAP + "[CHORUS]\r\n"
+        tail = self.SCOPED_GAP + self.SCOPED_BRIDGE + "\r\n"
+        assert lyrics.startswith(head)
+        assert lyrics.endswith(tail)
+        choruses = lyrics[len(head):-len(tail)].split(middle)
+        # Both copies of the chorus are rewritten together
+        assert len(choruses) == 2
+        assert choruses[0] == choruses[1]
+        assert choruses[0].strip()
+        # The new body keeps the song's CRLF line endings
+        assert "\n" not in lyrics.replace("\r\n", "")
+    
+    def test_custom_edit_section_keeps_other_sections(self, auth_headers):
+        """Test a custom edit scoped to one section leaves every other byte of the lyrics untouched"""
+        payload = {
+            "song_spec": {"topic": "Travel", "genre": "Country"},
+            "current_lyrics": self.scoped_lyrics(),
+            "section": "Verse 2",
+            "prompt": "Make it about the night instead of the morning"
+        }
+        response = requests.post(f"{BASE_URL}/api/lyrics/custom-edit", json=payload, headers=auth_headers, timeout=60)
+        assert response.status_code == 200
+        lyrics = response.json()["lyrics"]
+        
+        head = self.SCOPED_GAP.join([
+            self.SCOPED_PREAMBLE + self.SCOPED_VERSE_1, self.SCOPED_CHORUS, "[VERSE 2]\r\n"
+        ])
+        tail = self.SCOPED_GAP + self.SCOPED_CHORUS + self.SCOPED_GAP + self.SCOPED_BRIDGE + "\r\n"
+        assert lyrics.startswith(head)
+        assert lyrics.endswith(tail)
+        assert lyrics[len(head):-len(tail)].strip()
+        assert "\n" not in lyrics.replace("\r\n", "")
+
+    def test_generate_usage_is_metered(self, auth_headers):
+        """Test a generate call shows up in /api/admin/usage with nonzero tokens"""
+        me = requests.get(f"{BASE_URL}/api/auth/me", headers=auth_headers).json()
+        response = requests.post(
+            f"{BASE_URL}/api/lyrics/generate",
+            json={"song_spec": {"topic": "Morning coffee", "genre": "Folk"}},
+            headers=auth_headers, timeout=90
+        )
+        assert response.status_code == 200
+        
+        params = {"user_id": me["user_id"], "endpoint": "generate", "flush": "true"}
+        response = requests.get(f"{BASE_URL}/api/admin/usage", params=params, headers=auth_headers)
+        if response.status_code == 403:
+            pytest.skip("Test user is not in ADMIN_EMAILS")
+        assert response.status_code == 200
+        totals = response.json()["totals"]
+        assert totals["calls"] > 0
+        assert totals["input_tokens"] > 0
+        assert totals["output_tokens"] > 0
+
+
+class TestLyricsJobs:
+    """Tests for queued lyrics jobs"""
+    
+    @pytest.fixture
+    def auth_headers(self):
+        if not SESSION_TOKEN:
+            pytest.skip("No session token available")
+        return {"Authorization": f"Bearer {SESSION_TOKEN}", "Content-Type": "application/json"}
+    
+    def test_create_job_without_auth(self):
+        """Test POST /api/lyrics/jobs returns 401 without auth"""
+        payload = {"kind": "generate", "request": {"song_spec": {"topic": "Test"}}}
+        response = requests.post(f"{BASE_URL}/api/lyrics/jobs", json=payload)
+        assert response.status_code == 401
+    
+    def test_unknown_job_kind(self, auth_headers):
+        """Test POST /api/lyrics/jobs rejects unknown kinds"""
+        payload = {"kind": "compose-symphony", "request": {}}
+        response = requests.post(f"{BASE_URL}/api/lyrics/jobs", json=payload, headers=auth_headers)
+        assert response.status_code == 422
+    
+    def test_generate_job_round_trip(self, auth_headers):
+        """Test a queued generate job can be polled to completion"""
+        payload = {"kind": "generate", "request": {"song_spec": {"topic": "Summer rain", "genre": "Pop"}}}
+        response = requests.post(f"{BASE_URL}/api/lyrics/jobs", json=payload, headers=auth_headers)
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        
+        # Each long poll returns early once the job is final
+        for _ in range(6):
+            job = requests.get(f"{BASE_URL}/api/lyrics/jobs/{job_id}?wait=50", headers=auth_headers, timeout=60).json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+        assert job["status"] == "succeeded", job
+        assert len(job["result"]["lyrics"]) > 0
+
 
 class TestTransformFeature:
     """Specific tests for the Transform feature"""
@@ -295,6 +660,7 @@ class TestTransformFeature:
         data = response.json()
         assert "lyrics" in data
         assert len(data["lyrics"]) > 0
+        assert "cadence_score" in data["analysis"]
     
     def test_transform_minimal_options(self, auth_headers):
         """Test transform with minimal options"""
@@ -307,6 +673,17 @@ class TestTransformFeature:
         data = response.json()
         assert "lyrics" in data
 
+    def test_analyze_lyrics(self, auth_headers):
+        """Test /api/lyrics/analyze detects syllables and rhyme scheme locally"""
+        payload = {
+            "current_lyrics": "[VERSE 1]\nWalking down the street tonight\nEverything is feeling right\nI can see the city glow\nNowhere else I want to go"
+        }
+        response = requests.post(f"{BASE_URL}/api/lyrics/analyze", json=payload, headers=auth_headers)
+        assert response.status_code == 200
+        section = response.json()["sections"][0]
+        assert section["rhyme_scheme"] == "AABB"
+        assert len(section["syllables"]) == 4
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
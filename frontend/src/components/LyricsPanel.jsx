@@ -645,7 +645,7 @@ function VariationsModal({ open, onOpenChange, variations, isLoading, onSelect,
         </DialogHeader>
         
         <div className="flex-1 overflow-y-auto py-4">
-          {isLoading ? (
+          {isLoading && (!variations || variations.length === 0) ? (
             <div className="flex flex-col items-center justify-center py-12 space-y-4">
               <Loader2 className="w-8 h-8 animate-spin text-accent" />
               <p className="text-muted-foreground">Generating variations...</p>
@@ -663,6 +663,12 @@ function VariationsModal({ open, onOpenChange, variations, isLoading, onSelect,
                   </div>
                 );
               })}
+              {isLoading && (
+                <div className="flex items-center justify-center p-4 rounded-xl border border-dashed border-border/50 text-muted-foreground">
+                  <Loader2 className="w-4 h-4 mr-2 animate-spin text-accent" />
+                  Generating more...
+                </div>
+              )}
             </div>
           ) : (
             <div className="text-center py-12 text-muted-foreground">No variations generated</div>
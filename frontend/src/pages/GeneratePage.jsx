@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { toast } from 'sonner';
@@ -9,6 +9,51 @@ import { SongSpecPanel } from '@/components/SongSpecPanel';
 import { LyricsPanel } from '@/components/LyricsPanel';
 import { GENRES, defaultSongSpec } from '@/data/songData';
 
+// Reads an NDJSON stream, calling onEvent for each event. Aborting the
+// signal closes the connection, which cancels the work on the server.
+async function readNdjson(path, body, onEvent, signal) {
+  var response = await fetch(API + path, {
+    method: 'POST',
+    credentials: 'include',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+    signal: signal
+  });
+  if (!response.ok || !response.body) {
+    throw new Error('Stream request failed with status ' + response.status);
+  }
+  var reader = response.body.getReader();
+  var decoder = new TextDecoder();
+  var buffered = '';
+  while (true) {
+    var chunk = await reader.read();
+    if (chunk.done) break;
+    buffered += decoder.decode(chunk.value, { stream: true });
+    var lines = buffered.split('\n');
+    buffered = lines.pop();
+    for (var i = 0; i < lines.length; i++) {
+      if (lines[i]) onEvent(JSON.parse(lines[i]));
+    }
+  }
+}
+
+// Reads an NDJSON lyrics stream, calling onText with the lyrics so far.
+async function streamLyrics(path, body, onText) {
+  var text = '';
+  await readNdjson(path, body, function(event) {
+    if (event.type === 'token') {
+      text += event.text;
+      onText(text);
+    } else if (event.type === 'done') {
+      text = event.lyrics;
+      onText(text);
+    } else if (event.type === 'error') {
+      throw new Error(event.detail);
+    }
+  });
+  return text;
+}
+
 function GeneratePage({ user }) {
   var navigate = useNavigate();
   var [songSpec, setSongSpec] = useState(defaultSongSpec);
@@ -22,6 +67,7 @@ function GeneratePage({ user }) {
   var [availableSubgenres, setAvailableSubgenres] = useState([]);
   var [variations, setVariations] = useState([]);
   var [isGeneratingVariations, setIsGeneratingVariations] = useState(false);
+  var variationsAbort = useRef(null);
 
   useEffect(function() {
     if (songSpec.genre && GENRES[songSpec.genre]) {
@@ -58,11 +104,12 @@ function GeneratePage({ user }) {
 
   async function handleGenerate() {
     setIsGenerating(true);
+    var previousLyrics = lyrics;
     try {
-      var response = await axios.post(API + '/lyrics/generate', { song_spec: songSpec });
-      setLyrics(response.data.lyrics);
+      await streamLyrics('/lyrics/generate/stream', { song_spec: songSpec }, setLyrics);
       toast.success('Lyrics generated!');
     } catch (error) {
+      setLyrics(previousLyrics);
       console.error('Generate error:', error);
       toast.error('Failed to generate lyrics');
     } finally {
@@ -76,11 +123,12 @@ function GeneratePage({ user }) {
       return;
     }
     setIsGenerating(true);
+    var previousLyrics = lyrics;
     try {
-      var response = await axios.post(API + '/lyrics/rewrite', { song_spec: songSpec, current_lyrics: lyrics });
-      setLyrics(response.data.lyrics);
+      await streamLyrics('/lyrics/rewrite/stream', { song_spec: songSpec, current_lyrics: lyrics }, setLyrics);
       toast.success('Lyrics rewritten!');
     } catch (error) {
+      setLyrics(previousLyrics);
       console.error('Rewrite error:', error);
       toast.error('Failed to rewrite lyrics');
     } finally {
@@ -118,31 +166,46 @@ function GeneratePage({ user }) {
       toast.error('No lyrics to generate variations from');
       return;
     }
+    if (variationsAbort.current) variationsAbort.current.abort();
+    var controller = new AbortController();
+    variationsAbort.current = controller;
     setIsGeneratingVariations(true);
     setVariations([]);
+    var generated = 0;
     try {
-      var response = await axios.post(API + '/lyrics/variations', {
+      // Variations arrive in completion order, so show each as it lands
+      await readNdjson('/lyrics/variations/stream', {
         song_spec: songSpec,
         current_lyrics: lyrics,
         section: section,
         section_rhyme_scheme: rhymeScheme,
         count: 4
-      });
-      setVariations(response.data.variations);
-      if (response.data.variations.length === 0) {
+      }, function(event) {
+        if (event.type === 'variation') {
+          generated += 1;
+          setVariations(function(current) { return current.concat([event]); });
+        }
+      }, controller.signal);
+      if (generated === 0) {
         toast.error('Could not generate variations');
       } else {
-        toast.success('Generated ' + response.data.variations.length + ' variations!');
+        toast.success('Generated ' + generated + ' variations!');
       }
     } catch (error) {
+      if (error.name === 'AbortError') return;
       console.error('Variations error:', error);
       toast.error('Failed to generate variations');
     } finally {
-      setIsGeneratingVariations(false);
+      if (variationsAbort.current === controller) {
+        variationsAbort.current = null;
+        setIsGeneratingVariations(false);
+      }
     }
   }
 
+  // Picking or dismissing variations cancels the ones still generating
   function clearVariations() {
+    if (variationsAbort.current) variationsAbort.current.abort();
     setVariations([]);
   }
 
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { Badge } from '@/components/ui/badge';
@@ -34,20 +34,47 @@ const LibraryPage = ({ user }) => {
   const [searchQuery, setSearchQuery] = useState('');
   const [statusFilter, setStatusFilter] = useState('all');
   const [usedFilter, setUsedFilter] = useState('all');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const fetchAbort = useRef(null);
 
+  // Search and filters run server-side; debounce typing before refetching
   useEffect(() => {
-    fetchSongs();
-  }, []);
+    const timer = setTimeout(() => fetchSongs(null), searchQuery ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchQuery, statusFilter, usedFilter]);
 
-  const fetchSongs = async () => {
+  useEffect(() => () => fetchAbort.current?.abort(), []);
+
+  const fetchSongs = async (cursor) => {
+    // A new query cancels whatever is in flight, including "load more" pages,
+    // so a slow response to an older query can't replace newer results
+    if (!cursor || !fetchAbort.current) {
+      fetchAbort.current?.abort();
+      fetchAbort.current = new AbortController();
+    }
+    const { signal } = fetchAbort.current;
+    const params = { fields: 'summary', limit: 48 };
+    if (cursor) params.cursor = cursor;
+    if (searchQuery.trim()) params.q = searchQuery.trim();
+    if (statusFilter !== 'all') params.status = statusFilter;
+    if (usedFilter !== 'all') params.used_in_final_track = usedFilter === 'used';
+    if (cursor) setIsLoadingMore(true);
     try {
-      const response = await axios.get(`${API}/songs`);
-      setSongs(response.data);
+      const response = await axios.get(`${API}/songs`, { params, signal });
+      if (signal.aborted) return;
+      setSongs((prev) => (cursor ? prev.concat(response.data) : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
+      if (axios.isCancel(error)) return;
       console.error('Fetch songs error:', error);
       toast.error('Failed to load songs');
     } finally {
-      setIsLoading(false);
+      // A superseded request leaves the loading state to the one replacing it
+      if (!signal.aborted) {
+        setIsLoading(false);
+        setIsLoadingMore(false);
+      }
     }
   };
 
@@ -61,15 +88,7 @@ const LibraryPage = ({ user }) => {
     }
   };
 
-  // Filter songs
-  const filteredSongs = songs.filter(song => {
-    const matchesSearch = song.title.toLowerCase().includes(searchQuery.toLowerCase());
-    const matchesStatus = statusFilter === 'all' || song.status === statusFilter;
-    const matchesUsed = usedFilter === 'all' || 
-      (usedFilter === 'used' && song.used_in_final_track) ||
-      (usedFilter === 'unused' && !song.used_in_final_track);
-    return matchesSearch && matchesStatus && matchesUsed;
-  });
+  const hasFilters = searchQuery.trim() !== '' || statusFilter !== 'all' || usedFilter !== 'all';
 
   return (
     <div className="min-h-screen bg-background" data-testid="library-page">
@@ -163,23 +182,23 @@ const LibraryPage = ({ user }) => {
           <div className="flex items-center justify-center h-[60vh]">
             <Loader2 className="w-8 h-8 animate-spin text-primary" />
           </div>
-        ) : filteredSongs.length === 0 ? (
+        ) : songs.length === 0 ? (
           <div className="flex flex-col items-center justify-center h-[60vh] text-center space-y-6">
             <div className="w-24 h-24 rounded-2xl bg-primary/10 flex items-center justify-center">
               <FileText className="w-12 h-12 text-primary/50" />
             </div>
             <div className="space-y-2">
               <h3 className="text-2xl font-semibold font-['Outfit']">
-                {songs.length === 0 ? 'No songs yet' : 'No matching songs'}
+                {!hasFilters ? 'No songs yet' : 'No matching songs'}
               </h3>
               <p className="text-muted-foreground max-w-sm">
-                {songs.length === 0 
+                {!hasFilters
                   ? "Start creating your first song and it will appear here."
                   : "Try adjusting your filters or search query."
                 }
               </p>
             </div>
-            {songs.length === 0 && (
+            {!hasFilters && (
               <Button
                 onClick={() => navigate('/generate')}
                 className="bg-primary text-primary-foreground hover:bg-primary/90 rounded-full px-8"
@@ -191,11 +210,27 @@ const LibraryPage = ({ user }) => {
             )}
           </div>
         ) : (
-          <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-            {filteredSongs.map((song) => (
-              <SongCard key={song.song_id} song={song} onClick={() => navigate(`/song/${song.song_id}`)} />
-            ))}
-          </div>
+          <>
+            <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
+              {songs.map((song) => (
+                <SongCard key={song.song_id} song={song} onClick={() => navigate(`/song/${song.song_id}`)} />
+              ))}
+            </div>
+            {nextCursor && (
+              <div className="flex justify-center mt-8">
+                <Button
+                  variant="secondary"
+                  onClick={() => fetchSongs(nextCursor)}
+                  disabled={isLoadingMore}
+                  className="rounded-full px-8"
+                  data-testid="load-more-btn"
+                >
+                  {isLoadingMore && <Loader2 className="w-4 h-4 mr-2 animate-spin" />}
+                  Load more
+                </Button>
+              </div>
+            )}
+          </>
         )}
       </main>
     </div>
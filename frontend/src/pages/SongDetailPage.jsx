@@ -44,6 +44,7 @@ const SongDetailPage = ({ user }) => {
   const [editedLyrics, setEditedLyrics] = useState('');
   const [showDeleteDialog, setShowDeleteDialog] = useState(false);
   const [showHistoryDialog, setShowHistoryDialog] = useState(false);
+  const [versions, setVersions] = useState([]);
 
   useEffect(() => {
     fetchSong();
@@ -140,11 +141,41 @@ const SongDetailPage = ({ user }) => {
     toast.success('Lyrics copied to clipboard!');
   };
 
+  const handleOpenHistory = async (open) => {
+    setShowHistoryDialog(open);
+    if (!open) return;
+    if (!song.lyrics_version) {
+      // Saved before server-side versioning: history is still inline
+      setVersions((song.version_history || []).map((v, i) => ({
+        version: i + 1, saved_at: v.saved_at, lyrics_text: v.lyrics_text, line_count: v.lyrics_text.split('\n').length,
+      })).reverse());
+      return;
+    }
+    try {
+      const response = await axios.get(`${API}/songs/${songId}/versions`);
+      // The newest entry is the lyrics currently shown
+      setVersions(response.data.filter((v) => v.version !== song.lyrics_version));
+    } catch (error) {
+      console.error('Fetch versions error:', error);
+      toast.error('Failed to load history');
+    }
+  };
+
   const handleRestoreVersion = async (version) => {
-    setEditedLyrics(version.lyrics_text);
-    setIsEditing(true);
-    setShowHistoryDialog(false);
-    toast.info('Version restored. Click Save to confirm.');
+    try {
+      let lyricsText = version.lyrics_text;
+      if (lyricsText === undefined) {
+        const response = await axios.get(`${API}/songs/${songId}/versions/${version.version}`);
+        lyricsText = response.data.lyrics_text;
+      }
+      setEditedLyrics(lyricsText);
+      setIsEditing(true);
+      setShowHistoryDialog(false);
+      toast.info('Version restored. Click Save to confirm.');
+    } catch (error) {
+      console.error('Restore version error:', error);
+      toast.error('Failed to restore version');
+    }
   };
 
   if (isLoading) {
@@ -329,27 +360,27 @@ const SongDetailPage = ({ user }) => {
           <div className="bg-card/30 border border-border/50 rounded-2xl p-6 md:p-8">
             <div className="flex items-center justify-between mb-6">
               <h2 className="text-lg font-semibold font-['Outfit']">Lyrics</h2>
-              {song.version_history && song.version_history.length > 0 && (
-                <Dialog open={showHistoryDialog} onOpenChange={setShowHistoryDialog}>
+              {(song.lyrics_version > 1 || song.version_history?.length > 0) && (
+                <Dialog open={showHistoryDialog} onOpenChange={handleOpenHistory}>
                   <DialogTrigger asChild>
                     <Button variant="ghost" size="sm" data-testid="history-btn">
                       <History className="w-4 h-4 mr-2" />
-                      History ({song.version_history.length})
+                      History ({song.lyrics_version ? song.lyrics_version - 1 : song.version_history.length})
                     </Button>
                   </DialogTrigger>
                   <DialogContent className="max-w-2xl max-h-[80vh] overflow-y-auto">
                     <DialogHeader>
                       <DialogTitle>Version History</DialogTitle>
                       <DialogDescription>
-                        Previous versions of your lyrics (last 3 saved)
+                        Previously saved versions of your lyrics
                       </DialogDescription>
                     </DialogHeader>
                     <div className="space-y-4 mt-4">
-                      {song.version_history.slice().reverse().map((version, index) => (
-                        <div key={index} className="p-4 rounded-lg bg-muted/50 border border-border/50">
-                          <div className="flex items-center justify-between mb-2">
+                      {versions.map((version, index) => (
+                        <div key={version.version} className="p-4 rounded-lg bg-muted/50 border border-border/50">
+                          <div className="flex items-center justify-between">
                             <span className="text-sm text-muted-foreground">
-                              {format(new Date(version.saved_at), 'MMM d, yyyy h:mm a')}
+                              Version {version.version} · {format(new Date(version.saved_at), 'MMM d, yyyy h:mm a')} · {version.line_count} lines
                             </span>
                             <Button
                               variant="outline"
@@ -360,9 +391,6 @@ const SongDetailPage = ({ user }) => {
                               Restore
                             </Button>
                           </div>
-                          <pre className="text-sm whitespace-pre-wrap font-mono text-muted-foreground line-clamp-6">
-                            {version.lyrics_text}
-                          </pre>
                         </div>
                       ))}
                     </div>